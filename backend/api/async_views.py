@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import path, re_path
+
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+# Django 3.2 выполняет синхронные представления под ASGI в одном общем
+# потоке, поэтому асинхронные представления уходят в свой пул потоков.
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_THREADS,
+    thread_name_prefix='async-view'
+)
+
+
+def as_async_view(viewset, actions):
+    """Асинхронное представление для действий viewset DRF.
+
+    Асинхронного ORM в Django 3.2 нет, поэтому аутентификация, выборка,
+    сериализация и отрисовка ответа выполняются за один переход в поток
+    пула. Чтение запроса и отправка ответа медленным клиентам остаются
+    в цикле событий и поток не занимают.
+    """
+    view = viewset.as_view(actions)
+
+    def respond(request, *args, **kwargs):
+        # Сигналы начала и конца запроса закрывают соединения только в
+        # потоке обработчика, соединения потока пула закрываются здесь.
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs).render()
+        finally:
+            close_old_connections()
+        # Отрисованный ответ DRF обработчик ASGI всё равно отрисовывает
+        # в общем потоке, обычный HttpResponse этого перехода не требует.
+        return HttpResponse(
+            response.content, status=response.status_code,
+            headers=dict(response.items())
+        )
+
+    respond = sync_to_async(respond, thread_sensitive=False, executor=executor)
+
+    async def async_view(request, *args, **kwargs):
+        return await respond(request, *args, **kwargs)
+
+    # csrf_exempt из Django 3.2 делает из корутинной функции обычную.
+    async_view.csrf_exempt = True
+    async_view.cls = viewset
+    async_view.actions = actions
+    return async_view
+
+
+urlpatterns = [
+    path(
+        'tags/',
+        as_async_view(TagViewSet, {'get': 'list'}),
+        name='tags-list'
+    ),
+    path(
+        'ingredients/',
+        as_async_view(IngredientViewSet, {'get': 'list'}),
+        name='ingredients-list'
+    ),
+    path(
+        'recipes/',
+        as_async_view(RecipeViewSet, {'get': 'list', 'post': 'create'}),
+        name='recipes-list'
+    ),
+    re_path(
+        r'^recipes/(?P<pk>[0-9]+)/$',
+        as_async_view(RecipeViewSet, {
+            'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+            'delete': 'destroy'
+        }),
+        name='recipes-detail'
+    ),
+]
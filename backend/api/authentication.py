@@ -0,0 +1,143 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .caching import bump_version, get_version, get_versioned, set_versioned
+from .metrics import cache_lookup
+
+User = get_user_model()
+
+TOKEN_KEY = 'auth-token:{}'
+TOKEN_VERSION_KEY = 'auth-token-version:{}'
+# Хэш пароля не кэшируется: при обращении поле догрузится из базы.
+SNAPSHOT_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname != 'password'
+)
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш в памяти процесса со сроком жизни
+    записей."""
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._lock = Lock()
+        self._data = OrderedDict()
+        # Растёт при каждом удалении записи.
+        self._generation = 0
+
+    @property
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation=None):
+        """Сохраняет значение. С generation - только если с момента её
+        чтения ни одна запись не удалялась."""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._generation += 1
+
+
+local_tokens = LRUCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TIMEOUT
+)
+
+
+def shared_key(template, key):
+    # В общий кэш токен попадает только в виде хэша.
+    return template.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе для частых токенов.
+
+    Снимок полей пользователя хранится в LRU-кэше процесса, а при
+    AUTH_TOKEN_SHARED_CACHE_TIMEOUT > 0 - ещё и в общем кэше Django
+    вместе с версией токена. Выход через auth/token/logout и изменение
+    пользователя, в том числе деактивация, меняют версию, и снимки,
+    сохранённые по прочитанным до этого данным, больше не принимаются;
+    в других процессах запись из памяти живёт не дольше
+    AUTH_TOKEN_CACHE_TIMEOUT.
+    """
+
+    def authenticate_credentials(self, key):
+        timeout = settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT
+        generation = local_tokens.generation
+        snapshot = local_tokens.get(key)
+        cache_lookup('auth_token_local', snapshot is not None)
+        version = None
+        if snapshot is None and timeout:
+            snapshot, version = get_versioned(
+                shared_key(TOKEN_KEY, key), shared_key(TOKEN_VERSION_KEY, key)
+            )
+            cache_lookup('auth_token_shared', snapshot is not None)
+            if snapshot is not None:
+                local_tokens.set(key, snapshot, generation)
+        if snapshot is None:
+            if timeout and version is None:
+                version = get_version(
+                    shared_key(TOKEN_VERSION_KEY, key), timeout
+                )
+            user, token = super().authenticate_credentials(key)
+            snapshot = tuple(getattr(user, name) for name in SNAPSHOT_FIELDS)
+            local_tokens.set(key, snapshot, generation)
+            if timeout:
+                set_versioned(
+                    shared_key(TOKEN_KEY, key), version, snapshot, timeout
+                )
+            return user, token
+        user = User.from_db(User.objects.db, SNAPSHOT_FIELDS, snapshot)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
+
+
+def invalidate_token(key):
+    def discard():
+        local_tokens.discard(key)
+        if settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT:
+            bump_version(
+                shared_key(TOKEN_VERSION_KEY, key),
+                settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT
+            )
+    transaction.on_commit(discard)
+
+
+def invalidate_user_tokens(user_id):
+    for key in Token.objects.filter(user=user_id).values_list(
+        'key', flat=True
+    ):
+        invalidate_token(key)
@@ -0,0 +1,205 @@
+from array import array
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import IntegerField, Value
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+from .metrics import cache_lookup
+
+CATALOG_VERSION_KEY = 'catalog-version:{}'
+MEMBERSHIP_KEY = 'membership:{}'
+MEMBERSHIP_VERSION_KEY = 'membership-version:{}'
+
+
+def cache_is_shared():
+    """Виден ли кэш по умолчанию всем процессам.
+
+    Версию в кэше процесса не увидят ни другие процессы gunicorn, ни
+    команда upload_json, поэтому ETag по ней выдавать нельзя.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_version(key, timeout=None):
+    """Текущая версия из кэша, общая для всех процессов.
+
+    Версия - случайный токен, а не счётчик: после очистки кэша она не
+    совпадёт ни с одной ранее выданной.
+    """
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, uuid4().hex, timeout)
+    return cache.get(key)
+
+
+def bump_version(key, timeout=None):
+    cache.set(key, uuid4().hex, timeout)
+
+
+def get_versioned(key, version_key):
+    """Значение и текущая версия за одно обращение к кэшу.
+
+    Значение, сохранённое при другой версии, не возвращается: так
+    запись, которую запрос сохранил уже после сброса по данным из базы,
+    прочитанным до сброса, не переживает этот сброс.
+    """
+    values = cache.get_many((key, version_key))
+    version = values.get(version_key)
+    item = values.get(key)
+    if version is None or item is None or item[0] != version:
+        return None, version
+    return item[1], version
+
+
+def set_versioned(key, version, value, timeout):
+    """Сохраняет значение с версией, прочитанной до выборки из базы."""
+    cache.set(key, (version, value), timeout)
+
+
+def get_catalog_version(model):
+    """Текущая версия справочника, по ней строится ETag."""
+    return get_version(CATALOG_VERSION_KEY.format(model._meta.label_lower))
+
+
+def bump_catalog_version(model):
+    bump_version(CATALOG_VERSION_KEY.format(model._meta.label_lower))
+
+
+class CatalogCacheMixin:
+    """Отдаёт ETag по версии справочника и отвечает 304 на условные
+    запросы до выборки и сериализации данных.
+
+    С кэшем в памяти процесса ETag не выдаётся.
+    """
+    catalog_model = None
+
+    def get_etag(self, request):
+        if not hasattr(self, '_etag'):
+            self._etag = None
+            if cache_is_shared():
+                version = get_catalog_version(self.catalog_model)
+                self._etag = (
+                    f'"{version}-{request.accepted_renderer.format}"'
+                )
+        return self._etag
+
+    def not_modified(self, request):
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header or self.get_etag(request) is None:
+            return None
+        etags = {
+            etag[2:] if etag.startswith('W/') else etag
+            for etag in parse_etags(header)
+        }
+        not_modified = '*' in etags or self.get_etag(request) in etags
+        cache_lookup('catalog_etag', not_modified)
+        if not_modified:
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return (
+            self.not_modified(request)
+            or super().list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return (
+            self.not_modified(request)
+            or super().retrieve(request, *args, **kwargs)
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if request.method in SAFE_METHODS and response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            etag = self.get_etag(request)
+            if etag is not None:
+                response['ETag'] = etag
+            patch_cache_control(
+                response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE
+            )
+        return response
+
+
+class Membership:
+    """Id рецептов в избранном и корзине и id авторов в подписках
+    пользователя."""
+    # Модель, поле с id и атрибут для каждого множества.
+    SOURCES = (
+        (Favorite, 'recipe_id', 'favorites'),
+        (ShoppingCart, 'recipe_id', 'shopping_cart'),
+        (Follow, 'author_id', 'following'),
+    )
+
+    def __init__(self, favorites=(), shopping_cart=(), following=()):
+        self.favorites = frozenset(favorites)
+        self.shopping_cart = frozenset(shopping_cart)
+        self.following = frozenset(following)
+
+    @classmethod
+    def load(cls, user):
+        """Берёт множества из кэша, при промахе - одним запросом из базы.
+
+        В кэше хранятся отсортированные массивы 64-битных id в байтах
+        вместе с версией, которую меняет invalidate_membership.
+        """
+        key = MEMBERSHIP_KEY.format(user.pk)
+        version_key = MEMBERSHIP_VERSION_KEY.format(user.pk)
+        packed, version = get_versioned(key, version_key)
+        cache_lookup('membership', packed is not None)
+        if packed is None:
+            if version is None:
+                version = get_version(
+                    version_key, settings.MEMBERSHIP_CACHE_TIMEOUT
+                )
+            queries = [
+                model.objects.filter(user=user).annotate(
+                    kind=Value(kind, output_field=IntegerField())
+                ).values_list('kind', field)
+                for kind, (model, field, _) in enumerate(cls.SOURCES)
+            ]
+            ids = [[] for _ in cls.SOURCES]
+            for kind, pk in queries[0].union(*queries[1:], all=True):
+                ids[kind].append(pk)
+            packed = tuple(array('Q', sorted(values)).tobytes()
+                           for values in ids)
+            set_versioned(
+                key, version, packed, settings.MEMBERSHIP_CACHE_TIMEOUT
+            )
+        return cls(*(array('Q', values) for values in packed))
+
+
+def get_membership(request):
+    """Множества пользователя запроса, загружаются один раз за запрос."""
+    membership = getattr(request, '_membership', None)
+    if membership is None:
+        user = getattr(request, 'user', None)
+        membership = (
+            Membership() if user is None or user.is_anonymous
+            else Membership.load(user)
+        )
+        request._membership = membership
+    return membership
+
+
+def invalidate_membership(user_id):
+    transaction.on_commit(lambda: bump_version(
+        MEMBERSHIP_VERSION_KEY.format(user_id),
+        settings.MEMBERSHIP_CACHE_TIMEOUT
+    ))
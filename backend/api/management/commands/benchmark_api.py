@@ -0,0 +1,420 @@
+import json
+import os
+import random
+import time
+import tracemalloc
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment
+)
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeAmount, ShoppingCart, Tag,
+    recipe_search_vector
+)
+from users.models import Follow, User
+
+# Изображение 1x1 для рецептов, создаваемых при замере.
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+class Command(BaseCommand):
+    # Допустимое число SQL-запросов на один вызов эндпоинта при размере
+    # страницы по умолчанию. Превышение бюджета означает регрессию,
+    # чаще всего N+1 в сериализаторах. Первый запрос после изменения
+    # избранного, корзины или подписок добавляет один запрос на загрузку
+    # множеств пользователя. Токен проверяется по базе только при первом
+    # обращении, этот запрос приходится на users-list.
+    QUERY_BUDGETS = {
+        'users-list': 4,
+        'users-detail': 1,
+        'users-me': 0,
+        'users-subscriptions': 3,
+        'users-subscriptions-cursor': 2,
+        'users-subscribe': 7,
+        'users-unsubscribe': 4,
+        'tags-list': 1,
+        'tags-detail': 1,
+        'ingredients-list': 1,
+        'ingredients-search': 0,
+        'ingredients-detail': 1,
+        'recipes-list': 5,
+        'recipes-list-anonymous': 4,
+        'recipes-filtered': 5,
+        'recipes-cursor': 3,
+        'recipes-popular': 4,
+        'recipes-search': 4,
+        'recipes-cookable': 4,
+        'recipes-trending': 4,
+        'recipes-detail': 3,
+        'recipes-create': 17,
+        'recipes-update': 19,
+        'recipes-favorite': 6,
+        'recipes-unfavorite': 4,
+        'recipes-shopping-cart': 7,
+        'recipes-remove-shopping-cart': 6,
+        'recipes-download-shopping-cart': 1,
+        'recipes-shopping-cart-summary': 2,
+    }
+    help = ('Наполняет тестовую базу и замеряет число запросов, '
+            'задержку и память для эндпоинтов API')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=30)
+        parser.add_argument('--carts', type=int, default=10)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--output', type=str, default='api_benchmark.json'
+        )
+        parser.add_argument(
+            '--budget', action='append', default=[], metavar='NAME=N',
+            help='Переопределяет бюджет запросов для эндпоинта'
+        )
+        parser.add_argument(
+            '--data', type=str,
+            default=os.path.join(settings.BASE_DIR, 'data')
+        )
+
+    def handle(self, *args, **kwargs):
+        budgets = dict(self.QUERY_BUDGETS)
+        for item in kwargs['budget']:
+            name, _, value = item.partition('=')
+            if name not in budgets or not value.isdigit():
+                raise CommandError(f'Неверный бюджет: {item}')
+            budgets[name] = int(value)
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user, fixtures = self.seed(kwargs)
+            report = self.run(user, fixtures, kwargs['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        exceeded = []
+        failed = []
+        for name, result in report.items():
+            result['budget'] = budgets[name]
+            if result['queries'] > budgets[name]:
+                exceeded.append(name)
+            if result['status'] >= 400:
+                failed.append(name)
+            self.stdout.write(
+                f'{name:32} {result["status"]:>4} '
+                f'{result["queries"]:>3}/{budgets[name]:<3} '
+                f'p50={result["p50_ms"]:8.2f}ms '
+                f'p95={result["p95_ms"]:8.2f}ms '
+                f'peak={result["peak_memory_kb"]:9.1f}KB'
+            )
+        with open(kwargs['output'], 'wt', encoding='utf-8') as file:
+            json.dump(
+                {
+                    'dataset': {
+                        key: kwargs[key] for key in (
+                            'users', 'recipes', 'ingredients_per_recipe',
+                            'follows', 'favorites', 'carts'
+                        )
+                    },
+                    'iterations': kwargs['iterations'],
+                    'endpoints': report,
+                },
+                file, ensure_ascii=False, indent=2
+            )
+        if failed:
+            raise CommandError(
+                'Эндпоинты ответили ошибкой: ' + ', '.join(
+                    f'{name} ({report[name]["status"]})' for name in failed
+                )
+            )
+        if exceeded:
+            raise CommandError(
+                'Превышен бюджет запросов: ' + ', '.join(
+                    f'{name} ({report[name]["queries"]}/{budgets[name]})'
+                    for name in exceeded
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Бюджеты соблюдены, отчёт: {kwargs["output"]}'
+        ))
+
+    def seed(self, options):
+        rng = random.Random(0)
+        data_dir = options['data']
+        with open(os.path.join(data_dir, 'ingredients.json'),
+                  'rt', encoding='utf-8') as file:
+            Ingredient.objects.bulk_create(
+                Ingredient(**attrs) for attrs in json.load(file)
+            )
+        with open(os.path.join(data_dir, 'tags.json'),
+                  'rt', encoding='utf-8') as file:
+            Tag.objects.bulk_create(Tag(**attrs) for attrs in json.load(file))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.all())
+
+        User.objects.bulk_create(
+            User(
+                email=f'bench{i}@foodgram.ru', username=f'bench{i}',
+                first_name='Bench', last_name='User'
+            ) for i in range(max(options['users'], 2))
+        )
+        users = list(User.objects.order_by('id'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=rng.choice(users), name=f'Рецепт {i}',
+                text='Описание рецепта', cooking_time=rng.randint(1, 120),
+                image='recipies/image/benchmark.png'
+            ) for i in range(max(options['recipes'], 2))
+        )
+        Recipe.objects.update(search_vector=recipe_search_vector())
+        recipes = list(Recipe.objects.order_by('id'))
+        # Последний рецепт изменяет пользователь замера.
+        recipes[-1].author = users[0]
+        recipes[-1].save(update_fields=('author',))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, len(tags)))
+        )
+        RecipeAmount.objects.bulk_create(
+            RecipeAmount(
+                recipe=recipe, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient_id in rng.sample(
+                ingredient_ids, options['ingredients_per_recipe']
+            )
+        )
+        for model, per_user in ((Favorite, options['favorites']),
+                                (ShoppingCart, options['carts'])):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user in users
+                for recipe in rng.sample(
+                    recipes, min(per_user, len(recipes) - 1)
+                )
+            )
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for user in users
+            for author in rng.sample(
+                [other for other in users if other != user],
+                min(options['follows'], len(users) - 2)
+            )
+        )
+        # bulk_create не отправляет сигналы, счётчики и итоги корзин
+        # пересчитываются разом.
+        call_command('reconcile_counters', stdout=StringIO())
+        call_command('compute_recipe_scores', stdout=StringIO())
+        call_command('rebuild_ingredient_index', stdout=StringIO())
+
+        user = users[0]
+        followed = set(
+            user.follower.values_list('author_id', flat=True)
+        )
+        favorited = set(
+            user.favorite_recipes.values_list('recipe_id', flat=True)
+        )
+        in_cart = set(user.shopping_carts.values_list('recipe_id', flat=True))
+        fixtures = {
+            'author': next(
+                other for other in users
+                if other != user and other.id not in followed
+            ),
+            'recipe': recipes[0],
+            'own_recipe': recipes[-1],
+            'free_recipe': next(
+                recipe for recipe in recipes
+                if recipe.id not in favorited | in_cart
+            ),
+            'ingredient': Ingredient.objects.get(id=ingredient_ids[0]),
+            'pantry': list(recipes[0].ingredients.values_list(
+                'ingredient_id', flat=True
+            )[:3]) + ingredient_ids[1:4],
+            'tag': tags[0],
+            'tags': tags,
+            'ingredients': ingredient_ids[:4],
+        }
+        return user, fixtures
+
+    def endpoints(self, fixtures):
+        """Эндпоинты в порядке вызова: каждая пара POST/DELETE
+        возвращает базу в исходное состояние."""
+        author = fixtures['author'].id
+        recipe = fixtures['recipe'].id
+        free_recipe = fixtures['free_recipe'].id
+        prefix = fixtures['ingredient'].name[:2]
+        pantry = '&'.join(
+            f'ingredients={ingredient}' for ingredient in fixtures['pantry']
+        )
+        return (
+            ('users-list', 'get', reverse('api:users-list'), True),
+            ('users-detail', 'get',
+             reverse('api:users-detail', kwargs={'id': author}), True),
+            ('users-me', 'get', reverse('api:users-me'), True),
+            ('users-subscriptions', 'get',
+             reverse('api:users-subscriptions') + '?recipes_limit=3', True),
+            ('users-subscriptions-cursor', 'get',
+             reverse('api:users-subscriptions')
+             + '?cursor=&recipes_limit=3', True),
+            ('users-subscribe', 'post',
+             reverse('api:users-subscribe', kwargs={'id': author}), True),
+            ('users-unsubscribe', 'delete',
+             reverse('api:users-subscribe', kwargs={'id': author}), True),
+            ('tags-list', 'get', reverse('api:tags-list'), False),
+            ('tags-detail', 'get',
+             reverse('api:tags-detail', kwargs={'pk': fixtures['tag'].id}),
+             False),
+            ('ingredients-list', 'get', reverse('api:ingredients-list'),
+             False),
+            ('ingredients-search', 'get',
+             reverse('api:ingredients-list') + f'?name={prefix}', False),
+            ('ingredients-detail', 'get',
+             reverse('api:ingredients-detail',
+                     kwargs={'pk': fixtures['ingredient'].id}), False),
+            ('recipes-list', 'get', reverse('api:recipes-list'), True),
+            ('recipes-list-anonymous', 'get', reverse('api:recipes-list'),
+             False),
+            ('recipes-filtered', 'get',
+             reverse('api:recipes-list')
+             + f'?is_favorited=1&tags={fixtures["tag"].slug}', True),
+            ('recipes-cursor', 'get', reverse('api:recipes-list') + '?cursor=',
+             True),
+            ('recipes-popular', 'get',
+             reverse('api:recipes-list') + '?ordering=popular', True),
+            ('recipes-search', 'get',
+             reverse('api:recipes-list') + '?search=рецепт', True),
+            ('recipes-cookable', 'get',
+             reverse('api:recipes-cookable') + f'?{pantry}', False),
+            ('recipes-trending', 'get', reverse('api:recipes-trending'),
+             True),
+            ('recipes-detail', 'get',
+             reverse('api:recipes-detail', kwargs={'pk': recipe}), True),
+            ('recipes-create', 'post', reverse('api:recipes-list'), True),
+            ('recipes-update', 'patch',
+             reverse('api:recipes-detail',
+                     kwargs={'pk': fixtures['own_recipe'].id}), True),
+            ('recipes-favorite', 'post',
+             reverse('api:recipes-favorite', kwargs={'pk': free_recipe}),
+             True),
+            ('recipes-unfavorite', 'delete',
+             reverse('api:recipes-favorite', kwargs={'pk': free_recipe}),
+             True),
+            ('recipes-shopping-cart', 'post',
+             reverse('api:recipes-shopping-cart',
+                     kwargs={'pk': free_recipe}), True),
+            ('recipes-remove-shopping-cart', 'delete',
+             reverse('api:recipes-shopping-cart',
+                     kwargs={'pk': free_recipe}), True),
+            ('recipes-download-shopping-cart', 'get',
+             reverse('api:recipes-download-shopping-cart'), True),
+            ('recipes-shopping-cart-summary', 'get',
+             reverse('api:recipes-shopping-cart-summary'), True),
+        )
+
+    @staticmethod
+    def payloads(fixtures):
+        """Тела запросов на запись: новый рецепт и изменение своего."""
+        tags = [tag.id for tag in fixtures['tags'][:2]]
+        ingredients = fixtures['ingredients']
+        return {
+            'recipes-create': {
+                'name': 'Рецепт замера', 'text': 'Описание рецепта',
+                'cooking_time': 30, 'image': IMAGE, 'tags': tags,
+                'ingredients': [
+                    {'id': pk, 'amount': 100} for pk in ingredients[:3]
+                ],
+            },
+            'recipes-update': {
+                'name': 'Изменённый рецепт', 'tags': tags[:1],
+                'ingredients': [
+                    {'id': pk, 'amount': 50} for pk in ingredients[1:]
+                ],
+            },
+        }
+
+    @staticmethod
+    def call(client, name, method, url, payloads):
+        data = payloads.get(name)
+        if data is None:
+            response = getattr(client, method)(url)
+        else:
+            response = getattr(client, method)(url, data, format='json')
+        b''.join(getattr(response, 'streaming_content', []))
+        return response
+
+    @staticmethod
+    def cleanup(name, response):
+        """Удаляет созданный рецепт, чтобы не менять данные замера."""
+        if name == 'recipes-create' and response.status_code == 201:
+            Recipe.objects.filter(pk=response.data['id']).delete()
+
+    def run(self, user, fixtures, iterations):
+        token = Token.objects.create(user=user)
+        authorized = APIClient()
+        authorized.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        anonymous = APIClient()
+        endpoints = self.endpoints(fixtures)
+        payloads = self.payloads(fixtures)
+        timings = {name: [] for name, *_ in endpoints}
+        queries = dict.fromkeys(timings, 0)
+        # Худший код ответа за все повторы, чтобы ошибка не терялась.
+        statuses = dict.fromkeys(timings, 0)
+
+        for _ in range(max(iterations, 1)):
+            for name, method, url, auth in endpoints:
+                client = authorized if auth else anonymous
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = self.call(client, name, method, url, payloads)
+                    timings[name].append(time.perf_counter() - start)
+                queries[name] = max(
+                    queries[name], len(context.captured_queries)
+                )
+                statuses[name] = max(statuses[name], response.status_code)
+                self.cleanup(name, response)
+
+        peaks = {}
+        for name, method, url, auth in endpoints:
+            client = authorized if auth else anonymous
+            tracemalloc.start()
+            response = self.call(client, name, method, url, payloads)
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            statuses[name] = max(statuses[name], response.status_code)
+            self.cleanup(name, response)
+
+        return {
+            name: {
+                'status': statuses[name],
+                'queries': queries[name],
+                'p50_ms': self.percentile(timings[name], 50) * 1000,
+                'p95_ms': self.percentile(timings[name], 95) * 1000,
+                'peak_memory_kb': peaks[name] / 1024,
+            } for name in timings
+        }
+
+    @staticmethod
+    def percentile(values, percent):
+        values = sorted(values)
+        index = round(percent / 100 * (len(values) - 1))
+        return values[index]
@@ -0,0 +1,147 @@
+import json
+import time
+from io import BytesIO
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from foodgram.pooled_postgresql.base import DatabaseWrapper as PooledWrapper
+from .benchmark_api import Command as ApiBenchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку запросов без повторного использования '
+            'соединений с базой, с постоянными соединениями и с пулом')
+    MODES = ('per-request', 'persistent', 'pool')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument(
+            '--rate', type=float, default=50,
+            help='Запросов в секунду, 0 - без пауз'
+        )
+        parser.add_argument(
+            '--url', type=str, default=reverse('api:tags-list')
+        )
+        parser.add_argument(
+            '--output', type=str, default='connections_benchmark.json'
+        )
+
+    def handle(self, *args, **kwargs):
+        if connections['default'].vendor != 'postgresql':
+            raise CommandError('Замер имеет смысл только для PostgreSQL')
+        # Обработчик WSGI, в отличие от тестового клиента, закрывает
+        # соединения по сигналам начала и конца запроса, как gunicorn.
+        handler = WSGIHandler()
+        backend_pids = []
+
+        def remember_pid(sender, connection, **kwargs):
+            backend_pids.append(connection.connection.get_backend_pid())
+
+        connection_created.connect(remember_pid)
+        report = {}
+        try:
+            for mode in self.MODES:
+                backend_pids.clear()
+                with self.connection_mode(mode):
+                    timings = self.run(handler, kwargs)
+                report[mode] = {
+                    'p50_ms': ApiBenchmark.percentile(timings, 50) * 1000,
+                    'p95_ms': ApiBenchmark.percentile(timings, 95) * 1000,
+                    'connections_opened': len(set(backend_pids)),
+                }
+        finally:
+            connection_created.disconnect(remember_pid)
+
+        for mode, result in report.items():
+            self.stdout.write(
+                f'{mode:12} p50={result["p50_ms"]:7.2f}ms '
+                f'p95={result["p95_ms"]:7.2f}ms '
+                f'connections={result["connections_opened"]}'
+            )
+        with open(kwargs['output'], 'wt', encoding='utf-8') as file:
+            json.dump(
+                {
+                    'url': kwargs['url'],
+                    'requests': kwargs['requests'],
+                    'rate': kwargs['rate'],
+                    'modes': report,
+                },
+                file, ensure_ascii=False, indent=2
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Отчёт: {kwargs["output"]}'
+        ))
+
+    def connection_mode(self, mode):
+        """Подменяет соединение default на время замера режима."""
+        connections['default'].close()
+        settings_dict = dict(connections['default'].settings_dict)
+        if mode == 'per-request':
+            settings_dict['CONN_MAX_AGE'] = 0
+        elif mode == 'persistent':
+            settings_dict['CONN_MAX_AGE'] = max(
+                settings_dict['CONN_MAX_AGE'] or 0, 60
+            )
+        else:
+            settings_dict['CONN_MAX_AGE'] = 0
+            settings_dict.setdefault('POOL', {})
+        wrapper_class = PooledWrapper if mode == 'pool' else DatabaseWrapper
+        return SwappedConnection(wrapper_class(settings_dict, 'default'))
+
+    def run(self, handler, options):
+        interval = 1 / options['rate'] if options['rate'] else 0
+        timings = []
+        for _ in range(max(options['requests'], 1)):
+            start = time.perf_counter()
+            response = handler(self.environ(options['url']), self.ignore)
+            b''.join(response)
+            response.close()
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{options["url"]} ответил {response.status_code}'
+                )
+            timings.append(elapsed)
+            if interval > elapsed:
+                time.sleep(interval - elapsed)
+        return timings
+
+    @staticmethod
+    def environ(url):
+        path, _, query = url.partition('?')
+        return {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'wsgi.input': BytesIO(),
+            'wsgi.url_scheme': 'http',
+        }
+
+    @staticmethod
+    def ignore(status, headers, exc_info=None):
+        pass
+
+
+class SwappedConnection:
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+
+    def __enter__(self):
+        self.previous = connections['default']
+        connections['default'] = self.wrapper
+
+    def __exit__(self, *exc_info):
+        self.wrapper.close()
+        if isinstance(self.wrapper, PooledWrapper):
+            self.wrapper.pool.close()
+        connections['default'] = self.previous
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import shutil
+import socket
+import subprocess
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+from .benchmark_api import Command as ApiBenchmark
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер эндпоинтов чтения под gunicorn с '
+            'синхронными процессами WSGI и с процессами uvicorn ASGI')
+    SERVERS = {
+        'wsgi': ('foodgram.wsgi:application',),
+        'asgi': (
+            'foodgram.asgi:application',
+            '--worker-class', 'uvicorn.workers.UvicornWorker'
+        ),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servers', nargs='+', choices=tuple(self.SERVERS),
+            default=list(self.SERVERS)
+        )
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency', type=int, default=100,
+            help='Число одновременных клиентов'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность замера каждого сервера в секундах'
+        )
+        parser.add_argument(
+            '--slow-ms', type=int, default=50,
+            help=('Пауза клиента между строками запроса и между частями '
+                  'ответа в миллисекундах')
+        )
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--output', type=str, default='load_benchmark.json'
+        )
+
+    def handle(self, *args, **kwargs):
+        recipe = Recipe.objects.values_list('id', flat=True).first()
+        if recipe is None:
+            raise CommandError('Для замера в базе нужен хотя бы один рецепт')
+        paths = (
+            '/api/tags/', '/api/ingredients/', '/api/recipes/',
+            f'/api/recipes/{recipe}/',
+        )
+        report = {}
+        for name in kwargs['servers']:
+            with self.server(name, kwargs):
+                report[name] = asyncio.run(self.load(paths, kwargs))
+            result = report[name]
+            self.stdout.write(
+                f'{name:5} {result["rps"]:8.1f} rps '
+                f'p50={result["p50_ms"]:8.2f}ms '
+                f'p95={result["p95_ms"]:8.2f}ms '
+                f'p99={result["p99_ms"]:8.2f}ms '
+                f'errors={result["errors"]}'
+            )
+        with open(kwargs['output'], 'wt', encoding='utf-8') as file:
+            json.dump(
+                {
+                    'paths': paths,
+                    'options': {
+                        key: kwargs[key] for key in (
+                            'workers', 'concurrency', 'duration', 'slow_ms'
+                        )
+                    },
+                    'servers': report,
+                },
+                file, ensure_ascii=False, indent=2
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Отчёт: {kwargs["output"]}'
+        ))
+
+    def server(self, name, options):
+        gunicorn = shutil.which('gunicorn')
+        if gunicorn is None:
+            raise CommandError('Не найден gunicorn')
+        process = subprocess.Popen(
+            (
+                gunicorn, *self.SERVERS[name],
+                '--config', 'gunicorn.conf.py',
+                '--bind', f'127.0.0.1:{options["port"]}',
+                '--workers', str(options['workers']),
+            ),
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return RunningServer(process, options['port'])
+
+    async def load(self, paths, options):
+        # Первые запросы ждут запуска процессов и заполняют кэши.
+        for path in paths * options['workers']:
+            await self.request(options['port'], path, 0)
+        deadline = time.monotonic() + options['duration']
+        timings = []
+        statuses = Counter()
+
+        async def client(offset):
+            index = offset
+            while time.monotonic() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    status = await self.request(
+                        options['port'], path, options['slow_ms'] / 1000
+                    )
+                except OSError:
+                    status = 'error'
+                statuses[status] += 1
+                if status == 200:
+                    timings.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(
+            client(offset) for offset in range(options['concurrency'])
+        ))
+        timings = timings or [0]
+        return {
+            'rps': statuses[200] / options['duration'],
+            'p50_ms': ApiBenchmark.percentile(timings, 50) * 1000,
+            'p95_ms': ApiBenchmark.percentile(timings, 95) * 1000,
+            'p99_ms': ApiBenchmark.percentile(timings, 99) * 1000,
+            'errors': sum(
+                count for status, count in statuses.items() if status != 200
+            ),
+            'statuses': {
+                str(status): count for status, count in statuses.items()
+            },
+        }
+
+    @staticmethod
+    async def request(port, path, pause):
+        """Запрос медленного клиента: строки заголовка уходят, а ответ
+        читается частями по 16 КБ с паузой pause между ними."""
+        # Маленький буфер приёма не даёт ядру принять весь ответ сразу,
+        # и сервер ждёт клиента, как при медленной сети.
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        sock.setblocking(False)
+        try:
+            await asyncio.get_running_loop().sock_connect(
+                sock, ('127.0.0.1', port)
+            )
+        except BaseException:
+            sock.close()
+            raise
+        reader, writer = await asyncio.open_connection(sock=sock)
+        try:
+            for line in (
+                f'GET {path} HTTP/1.1\r\n',
+                'Host: localhost\r\n',
+                'Connection: close\r\n',
+            ):
+                writer.write(line.encode())
+                await writer.drain()
+                if pause:
+                    await asyncio.sleep(pause)
+            writer.write(b'\r\n')
+            status_line = await reader.readline()
+            while await reader.read(16384):
+                if pause:
+                    await asyncio.sleep(pause)
+        finally:
+            writer.close()
+        parts = status_line.split()
+        return int(parts[1]) if len(parts) > 1 else 'error'
+
+
+class RunningServer:
+    """Ждёт, пока сервер начнёт принимать соединения, и
+    останавливает его по выходе."""
+
+    def __init__(self, process, port, timeout=30):
+        self.process = process
+        self.port = port
+        self.timeout = timeout
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError('Сервер завершился при запуске')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), 1).close()
+            except OSError:
+                time.sleep(0.2)
+            else:
+                return self
+        self.stop()
+        raise CommandError('Сервер не начал принимать соединения')
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
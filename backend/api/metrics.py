@@ -0,0 +1,177 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest, multiprocess
+)
+
+# Счётчик SQL-запросов обрабатываемого HTTP-запроса.
+current_queries = ContextVar('current_queries', default=None)
+
+# Размеры в байтах: от 1 КБ до 16 МБ с шагом в 4 раза.
+SIZE_BUCKETS = tuple(1024 * 4 ** power for power in range(8))
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса по действию представления',
+    ('view', 'method', 'status')
+)
+REQUEST_QUERIES = Histogram(
+    'foodgram_request_queries',
+    'Число SQL-запросов на один запрос к API',
+    ('view',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+DB_CONNECTIONS = Counter(
+    'foodgram_db_connections_opened_total',
+    'Открытые соединения с базой данных'
+)
+# Под gunicorn значения пулов живых процессов складываются.
+DB_POOL_SIZE = Gauge(
+    'foodgram_db_pool_size',
+    'Наибольшее число соединений в пуле',
+    ('alias',),
+    multiprocess_mode='livesum'
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'foodgram_db_pool_connections',
+    'Открытые соединения пула: выданные (in_use) и свободные (idle)',
+    ('alias', 'state'),
+    multiprocess_mode='livesum'
+)
+CACHE_LOOKUPS = Counter(
+    'foodgram_cache_lookups_total',
+    'Обращения к кэшам приложения по результату',
+    ('cache', 'result')
+)
+PDF_RENDER_SECONDS = Histogram(
+    'foodgram_pdf_render_seconds',
+    'Время формирования PDF со списком покупок'
+)
+PDF_BYTES = Histogram(
+    'foodgram_pdf_bytes',
+    'Размер PDF со списком покупок',
+    buckets=SIZE_BUCKETS
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'foodgram_image_upload_bytes',
+    'Размер загруженных изображений рецептов',
+    buckets=SIZE_BUCKETS
+)
+
+
+def cache_lookup(name, hit):
+    CACHE_LOOKUPS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+def measure_pdf(func):
+    """Учитывает время формирования и размер PDF."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with PDF_RENDER_SECONDS.time():
+            content = func(*args, **kwargs)
+        PDF_BYTES.observe(len(content))
+        return content
+    return wrapper
+
+
+def view_label(view_func, method):
+    """Имя вида RecipeViewSet.list для представлений DRF."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method.lower(), method.lower())}'
+
+
+def count_query(execute, sql, params, many, context):
+    """Обёртка всех соединений: добавляет запрос к счётчику текущего
+    HTTP-запроса.
+
+    Счётчик хранится в ContextVar, который sync_to_async копирует в
+    поток представления, поэтому под ASGI учитываются и запросы
+    синхронных представлений из общего потока, и асинхронных из пула.
+    """
+    counter = current_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Замеряет время и число SQL-запросов каждого запроса.
+
+    Работает и в асинхронной цепочке ASGI, чтобы не переводить её в
+    поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Так Django распознаёт экземпляр как корутинную функцию.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        queries = [0]
+        token = current_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.observe(request, response, start, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        queries = [0]
+        token = current_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.observe(request, response, start, queries[0])
+        return response
+
+    @staticmethod
+    def observe(request, response, start, queries):
+        match = request.resolver_match
+        view = (
+            view_label(match.func, request.method) if match else 'unmatched'
+        )
+        REQUEST_LATENCY.labels(
+            view, request.method, response.status_code
+        ).observe(time.perf_counter() - start)
+        REQUEST_QUERIES.labels(view).observe(queries)
+
+
+def metrics(request):
+    """Метрики в формате Prometheus, общие для всех процессов gunicorn.
+
+    При заданном PROMETHEUS_MULTIPROC_DIR значения каждого процесса
+    пишутся в свой файл в этом каталоге и суммируются при чтении.
+    """
+    token = settings.METRICS_TOKEN
+    # Без токена эндпоинт закрыт: nginx проксирует весь /api/ наружу.
+    if not token or not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
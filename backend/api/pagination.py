@@ -1,6 +1,46 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация без COUNT(*) и OFFSET по базе."""
+    page_size = 6
+    page_size_query_param = 'limit'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация с необязательным курсорным режимом.
+
+    Курсорный режим включается параметром cursor (первая страница -
+    пустой cursor=) для представлений, задающих cursor_ordering. С
+    параметрами ordering_params, которые задают свой порядок, курсор
+    не используется.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering_params = ('ordering', 'search')
+    keyset_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if (
+            ordering
+            and self.cursor_query_param in request.query_params
+            and not any(
+                request.query_params.get(param)
+                for param in self.ordering_params
+            )
+        ):
+            self.keyset_paginator = KeysetPagination(ordering)
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
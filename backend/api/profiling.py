@@ -0,0 +1,206 @@
+import cProfile
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from drf_extra_fields.fields import Base64FieldMixin
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    """Замеры одного запроса: SQL, именованные участки кода и cProfile."""
+
+    def __init__(self, request, with_cprofile):
+        self.request = request
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.statements = {}
+        self.sections = defaultdict(float)
+        self.active = set()
+        self.cprofile = cProfile.Profile() if with_cprofile else None
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            # Параметры передаются отдельно, поэтому текст запроса уже
+            # одинаков для повторов с разными значениями.
+            fingerprint = hashlib.sha1(sql.encode()).hexdigest()[:12]
+            self.fingerprints[fingerprint] += 1
+            self.statements.setdefault(fingerprint, sql)
+
+    def duplicates(self):
+        return [
+            {
+                'fingerprint': fingerprint,
+                'count': count,
+                'sql': self.statements[fingerprint][:300],
+            }
+            for fingerprint, count in self.fingerprints.most_common()
+            if count > 1
+        ]
+
+    def timings(self):
+        """Длительности участков в миллисекундах."""
+        total = time.perf_counter() - self.start
+        timings = {'total': total, 'sql': self.sql_time}
+        timings.update(self.sections)
+        return {name: value * 1000 for name, value in timings.items()}
+
+
+@contextmanager
+def section(name):
+    """Добавляет время выполнения блока к участку name текущего запроса.
+
+    Вложенные блоки с тем же именем не учитываются повторно.
+    """
+    profile = current_profile.get()
+    if profile is None or name in profile.active:
+        yield
+        return
+    profile.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections[name] += time.perf_counter() - start
+        profile.active.discard(name)
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with section(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Класс, метод и участок, к которому относится его время.
+INSTRUMENTED = (
+    (serializers.Serializer, 'to_representation', 'serializer'),
+    (serializers.ListSerializer, 'to_representation', 'serializer'),
+    (serializers.SerializerMethodField, 'to_representation', 'method_fields'),
+    (Base64FieldMixin, 'to_internal_value', 'base64_decode'),
+)
+
+
+def instrument():
+    """Оборачивает методы сериализаторов DRF замерами один раз на
+    процесс."""
+    for cls, method, name in INSTRUMENTED:
+        func = cls.__dict__[method]
+        if not getattr(func, 'profiled', False):
+            wrapper = timed(name)(func)
+            wrapper.profiled = True
+            setattr(cls, method, wrapper)
+
+
+class ProfilingMiddleware:
+    """Профилирование выборки запросов, включается PROFILING_ENABLED.
+
+    Для PROFILING_SAMPLE_RATE доли запросов считает число и время SQL,
+    повторяющиеся запросы и время сериализации, отдаёт их в заголовке
+    Server-Timing и пишет строку JSON в лог api.profiling. Запросы
+    дольше PROFILING_SLOW_MS при заданном PROFILING_DUMP_DIR сохраняются
+    как дамп cProfile.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument()
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = RequestProfile(request, bool(settings.PROFILING_DUMP_DIR))
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.record_query)
+                    )
+                if profile.cprofile:
+                    profile.cprofile.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profile.cprofile:
+                        profile.cprofile.disable()
+        finally:
+            current_profile.reset(token)
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={value:.1f}'
+            for name, value in profile.timings().items()
+        )
+        if response.streaming:
+            response.streaming_content = self.stream(
+                profile, response, response.streaming_content
+            )
+        else:
+            self.finish(profile, response)
+        return response
+
+    def stream(self, profile, response, content):
+        """Учитывает формирование потокового ответа в логе и дампе."""
+        iterator = iter(content)
+        while True:
+            token = current_profile.set(profile)
+            if profile.cprofile:
+                profile.cprofile.enable()
+            try:
+                with section('stream'):
+                    chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                if profile.cprofile:
+                    profile.cprofile.disable()
+                current_profile.reset(token)
+            yield chunk
+        self.finish(profile, response)
+
+    def finish(self, profile, response):
+        request = profile.request
+        match = request.resolver_match
+        timings = profile.timings()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': profile.queries,
+            'timings_ms': {
+                name: round(value, 2) for name, value in timings.items()
+            },
+            'duplicates': profile.duplicates(),
+        }, ensure_ascii=False))
+        if profile.cprofile and timings['total'] >= settings.PROFILING_SLOW_MS:
+            name = (match.view_name if match else 'unknown').replace(':', '-')
+            profile.cprofile.dump_stats(os.path.join(
+                settings.PROFILING_DUMP_DIR,
+                f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-'
+                f'{timings["total"]:.0f}ms.prof'
+            ))
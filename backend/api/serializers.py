@@ -1,12 +1,18 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 
+from recipes.images import rendition_storage
 from recipes.models import (
-    Tag, Ingredient, Recipe, RecipeAmount, Favorite, ShoppingCart
+    CartTotal, Tag, Ingredient, IngredientPosting, Recipe, RecipeAmount,
+    Favorite, ShoppingCart
 )
+from .caching import get_membership
+from .metrics import IMAGE_UPLOAD_BYTES
 
 User = get_user_model()
 
@@ -23,10 +29,13 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         request = self.context.get('request')
-        if request.user.is_anonymous:
+        if request is None:
             return False
-        return obj.following.filter(user=request.user).exists()
+        return obj.id in get_membership(request).following
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -58,6 +67,34 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "color", "slug")
 
 
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения по формату и ширине.
+
+    Пока копии текущего изображения готовятся, в том числе после его
+    замены, возвращается пустой словарь.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        renditions = recipe.image_renditions
+        if renditions.get('source') != recipe.image.name:
+            return {}
+        request = self.context.get('request')
+        return {
+            name: {
+                width: (
+                    request.build_absolute_uri(rendition_storage.url(path))
+                    if request else rendition_storage.url(path)
+                )
+                for width, path in paths.items()
+            }
+            for name, paths in renditions.items() if name != 'source'
+        }
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор для просмотра рецептов."""
     tags = TagSerializer(many=True)
@@ -67,37 +104,53 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(max_length=None)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author',
-            'ingredients', 'name', 'image',
+            'ingredients', 'name', 'image', 'image_renditions',
             'text', 'cooking_time', 'is_favorited',
             'is_in_shopping_cart'
         )
 
     def get_is_favorited(self, obj):
         request = self.context.get("request")
-        if not request or request.user.is_anonymous:
+        if not request:
             return False
-        return request.user.favorite_recipes.filter(recipe=obj).exists()
+        return obj.id in get_membership(request).favorites
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get("request")
-        if not request or request.user.is_anonymous:
+        if not request:
             return False
-        return request.user.shopping_carts.filter(recipe=obj).exists()
+        return obj.id in get_membership(request).shopping_cart
+
+
+class IngredientAmountWriteSerializer(serializers.Serializer):
+    """Сериализатор ингредиента в составе сохраняемого рецепта.
+
+    Ингредиенты по id загружает RecipeWriteSerializer одним запросом.
+    """
+    id = serializers.IntegerField()
+    # Границы поля PositiveSmallIntegerField модели RecipeAmount.
+    amount = serializers.IntegerField(
+        min_value=1, max_value=32767,
+        error_messages={
+            'min_value': 'Количество не может быть меньше единицы!',
+            'max_value': 'Количество не может быть больше {max_value}!',
+        }
+    )
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецептов."""
-    ingredients = RecipeAmountSerializer(
+    ingredients = IngredientAmountWriteSerializer(
         many=True
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
+    tags = serializers.ListField(
+        child=serializers.IntegerField()
     )
     image = Base64ImageField(max_length=None)
     author = UserSerializer(read_only=True)
@@ -111,10 +164,15 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'text', 'cooking_time',)
 
     def validate_tags(self, tags):
-        for tag in tags:
-            if not Tag.objects.filter(id=tag.id).exists():
-                raise serializers.ValidationError("Выбранный тег отсутствует!")
-        return tags
+        tag_ids = set(tags)
+        found = Tag.objects.in_bulk(tag_ids)
+        if len(found) != len(tag_ids):
+            raise serializers.ValidationError("Выбранный тег отсутствует!")
+        return [found[tag_id] for tag_id in dict.fromkeys(tags)]
+
+    def validate_image(self, image):
+        IMAGE_UPLOAD_BYTES.observe(image.size)
+        return image
 
     def validate_cooking_time(self, cooking_time):
         if cooking_time < 1:
@@ -123,60 +181,144 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return cooking_time
 
     def validate_ingredients(self, ingredients):
-        ingredient_list = []
         if not ingredients:
             raise serializers.ValidationError("Ингредиенты отстустствуют!")
+        ingredient_ids = set()
         for elem in ingredients:
-            if elem["ingredient"].get("id") in ingredient_list:
-                raise serializers.ValidationError(
-                    f'{elem["ingredient"]} не может быть добавлен дважды!')
-            ingredient_list.append(elem["ingredient"].get("id"))
-            print(elem)
-            if int(elem.get("amount")) < 1:
+            if elem["id"] in ingredient_ids:
                 raise serializers.ValidationError(
-                    "Количество не может быть меньше единицы!")
-        return ingredients
+                    f'Ингредиент {elem["id"]} не может быть добавлен дважды!')
+            ingredient_ids.add(elem["id"])
+        found = Ingredient.objects.in_bulk(ingredient_ids)
+        if len(found) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                "Выбранный ингредиент отсутствует!")
+        return [
+            {'ingredient': found[elem["id"]], 'amount': elem["amount"]}
+            for elem in ingredients
+        ]
 
     @staticmethod
     def bound_ingredients_recipe(ingredients, recipe):
         return [
             RecipeAmount(
-                ingredient=data.pop('ingredient').get("id"),
-                amount=data.pop('amount'),
+                ingredient=data['ingredient'],
+                amount=data['amount'],
                 recipe=recipe) for data in ingredients
         ]
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(author=request.user, **validated_data)
         recipe.tags.set(tags)
-        RecipeAmount.objects.bulk_create(
+        amounts = RecipeAmount.objects.bulk_create(
             self.bound_ingredients_recipe(ingredients, recipe)
         )
+        IngredientPosting.objects.replace(
+            recipe.id, (), [amount.ingredient_id for amount in amounts]
+        )
         return recipe
 
-    def update(self, instance, validated_data):
-        instance.tags.clear()
-        RecipeAmount.objects.filter(recipe=instance).delete()
-        instance.tags.set(validated_data.pop('tags'))
-        ingredients = validated_data.pop('ingredients')
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Приводит количества ингредиентов рецепта к новому составу,
+        затрагивая только изменившиеся строки.
+
+        Изменение количества стоит одного UPDATE и одного INSERT ...
+        SELECT в итоги корзин. Второй выполняется, даже если рецепта нет
+        ни в одной корзине: проверка заранее стоила бы того же запроса.
+        """
+        existing = {
+            amount.ingredient_id: amount
+            for amount in recipe.ingredients.all()
+        }
+        amounts = {
+            data['ingredient'].id: data['amount'] for data in ingredients
+        }
+        CartTotal.objects.update_recipe(
+            recipe.id,
+            {pk: current.amount for pk, current in existing.items()},
+            amounts
+        )
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            current = existing.get(ingredient_id)
+            if current is not None and current.amount != amount:
+                current.amount = amount
+                changed.append(current)
+        removed = [
+            current.id for ingredient_id, current in existing.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            RecipeAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeAmount.objects.bulk_update(changed, ('amount',))
         RecipeAmount.objects.bulk_create(
-            self.bound_ingredients_recipe(ingredients, instance)
+            RecipeAmount(recipe=recipe, ingredient_id=ingredient_id,
+                         amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
         )
-        return super().update(instance, validated_data)
+        IngredientPosting.objects.replace(recipe.id, existing, amounts)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        changed = [
+            name for name, value in validated_data.items()
+            if getattr(instance, name) != value
+        ]
+        for name in changed:
+            setattr(instance, name, validated_data[name])
+        if changed:
+            instance.save(update_fields=changed)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        # Теги и количества записаны в обход кэша prefetch_related из
+        # get_object(), без сброса ответ покажет прежний состав.
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        if tags is not None:
+            prefetched.pop('tags', None)
+        if ingredients is not None:
+            prefetched.pop('ingredients', None)
+        return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], 'tags', Prefetch(
+                'ingredients',
+                queryset=RecipeAmount.objects.select_related('ingredient')
+            )
+        )
         return RecipeReadSerializer(
             instance, context={'request': self.context.get('request')}).data
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор полей избранных рецептов и корзины с покупками."""
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
+
+
+class CookableRecipeSerializer(RecipeShortSerializer):
+    """Сериализатор рецептов, подобранных по имеющимся ингредиентам."""
+    coverage = serializers.ReadOnlyField()
+    missing_ingredients = IngredientSerializer(many=True, read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients'
+        )
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -201,12 +343,15 @@ class FavoriteSerializer(serializers.ModelSerializer):
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Сериализатор для добавления в корзину покупок."""
+    """Сериализатор для добавления в корзину покупок и изменения
+    множителя порций."""
     class Meta:
         model = ShoppingCart
-        fields = ("user", "recipe")
+        fields = ("user", "recipe", "servings")
 
     def validate(self, data):
+        if self.instance is not None:
+            return data
         user = data['user']
         if user.shopping_carts.filter(recipe=data['recipe']).exists():
             raise serializers.ValidationError(
@@ -214,16 +359,22 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        return super().update(instance, validated_data)
+
     def to_representation(self, inctance):
-        return RecipeShortSerializer(
+        data = RecipeShortSerializer(
             inctance.recipe,
             context={'requst': self.context.get('request')}
         ).data
+        data['servings'] = inctance.servings
+        return data
 
 
 class SubsctiptionListSerializer(UserSerializer):
     """Сериализатор подписок."""
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
     recipes = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
@@ -260,6 +411,3 @@ class SubsctiptionListSerializer(UserSerializer):
                 )
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
@@ -0,0 +1,80 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Favorite, Ingredient, ShoppingCart, Tag
+from users.models import Follow, User
+from .authentication import invalidate_token, invalidate_user_tokens
+from .caching import bump_catalog_version, invalidate_membership
+from .metrics import DB_CONNECTIONS, count_query
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_catalog(sender, **kwargs):
+    bump_catalog_version(sender)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def reset_membership(sender, instance, **kwargs):
+    invalidate_membership(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def reset_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def reset_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS.inc()
+    # Объект соединения переживает переподключения, обёртка ставится
+    # один раз. Соединение может открыться внутри execute_wrapper(),
+    # который снимает свою обёртку с конца списка, поэтому эта
+    # встаёт в начало.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+@receiver(request_finished)
+def mark_connections_idle(sender, **kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+@receiver(request_started)
+def check_idle_connections(sender, **kwargs):
+    """Закрывает постоянные соединения, которые долго простаивали и
+    перестали отвечать, чтобы запрос открыл новое."""
+    now = time.monotonic()
+    for connection in connections.all():
+        idle_since = getattr(connection, 'idle_since', None)
+        if (
+            connection.connection is not None
+            and idle_since is not None
+            and now - idle_since >= settings.DB_CONN_HEALTH_CHECK_AFTER
+            and not connection.in_atomic_block
+            and not connection.is_usable()
+        ):
+            connection.close()
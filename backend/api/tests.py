@@ -0,0 +1,485 @@
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipes import images
+from recipes.models import ImageJob, Ingredient, Recipe, Tag
+from users.models import User
+from .authentication import invalidate_token
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+MEDIA_ROOT = tempfile.mkdtemp()
+# Общий кэш по умолчанию пережил бы тестовую базу, где id начинаются
+# заново, поэтому у тестов свой каталог.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }
+}
+
+
+def image_data(color):
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=CACHES)
+class RecipeTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@foodgram.ru', username='cook', password='secret',
+            first_name='Cook', last_name='Cook'
+        )
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+            )
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар', 'соль')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def recipe_data(self, tags, amounts):
+        return {
+            'name': 'Блины',
+            'text': 'Смешать и пожарить',
+            'cooking_time': 20,
+            'image': IMAGE,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts
+            ],
+        }
+
+    @staticmethod
+    def composition(response):
+        return sorted(
+            (item['id'], item['amount'])
+            for item in response.data['ingredients']
+        )
+
+
+class RecipeWriteTests(RecipeTestCase):
+    def test_update_returns_new_ingredients_and_tags(self):
+        flour, sugar, salt = self.ingredients
+        response = self.client.post(
+            reverse('api:recipes-list'),
+            self.recipe_data(self.tags[:1], ((flour, 200), (sugar, 50))),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = reverse('api:recipes-detail', kwargs={'pk': response.data['id']})
+
+        for method, tags, amounts in (
+            ('patch', self.tags[1:], ((flour, 300), (salt, 5))),
+            ('put', self.tags, ((sugar, 10),)),
+        ):
+            with self.subTest(method=method):
+                response = getattr(self.client, method)(
+                    url, self.recipe_data(tags, amounts), format='json'
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    self.composition(response),
+                    sorted(
+                        (ingredient.id, amount)
+                        for ingredient, amount in amounts
+                    )
+                )
+                self.assertEqual(
+                    sorted(tag['id'] for tag in response.data['tags']),
+                    [tag.id for tag in tags]
+                )
+                self.assertEqual(
+                    self.composition(self.client.get(url)),
+                    self.composition(response)
+                )
+
+    def test_amount_change_query_count(self):
+        flour, sugar, _ = self.ingredients
+        response = self.client.post(
+            reverse('api:recipes-list'),
+            self.recipe_data(self.tags, ((flour, 200), (sugar, 50))),
+            format='json'
+        )
+        url = reverse('api:recipes-detail', kwargs={'pk': response.data['id']})
+        data = {'ingredients': [
+            {'id': flour.id, 'amount': 300}, {'id': sugar.id, 'amount': 50}
+        ]}
+        # Рецепт с тегами и составом, проверка ингредиентов, SAVEPOINT,
+        # перенос разницы в итоги корзин (выполняется и без корзин с
+        # рецептом), один UPDATE количества, RELEASE и состав для ответа.
+        with self.assertNumQueries(10):
+            response = self.client.patch(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_amount_out_of_range_is_rejected(self):
+        flour = self.ingredients[0]
+        for amount in (0, -5, 32768):
+            with self.subTest(amount=amount):
+                response = self.client.post(
+                    reverse('api:recipes-list'),
+                    self.recipe_data(self.tags, ((flour, amount),)),
+                    format='json'
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertIn('ingredients', response.data)
+
+    def test_renditions_of_replaced_image_are_hidden(self):
+        response = self.client.post(
+            reverse('api:recipes-list'),
+            self.recipe_data(self.tags, ((self.ingredients[0], 1),)),
+            format='json'
+        )
+        self.assertEqual(response.data['image_renditions'], {})
+        url = reverse('api:recipes-detail', kwargs={'pk': response.data['id']})
+        images.process(images.claim())
+        renditions = self.client.get(url).data['image_renditions']
+        self.assertEqual(set(renditions), {'webp', 'jpeg'})
+
+        response = self.client.patch(
+            url, {'image': image_data('red')}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['image_renditions'], {})
+        self.assertEqual(self.client.get(url).data['image_renditions'], {})
+        images.process(images.claim())
+        self.assertEqual(
+            set(self.client.get(url).data['image_renditions']),
+            {'webp', 'jpeg'}
+        )
+
+
+class CookableTests(RecipeTestCase):
+    def create(self, ingredients):
+        response = self.client.post(
+            reverse('api:recipes-list'),
+            self.recipe_data(
+                self.tags, ((ingredient, 1) for ingredient in ingredients)
+            ),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def cookable(self, ingredients, **params):
+        response = self.client.get(
+            reverse('api:recipes-cookable'),
+            {'ingredients': [ingredient.id for ingredient in ingredients],
+             **params}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_recipes_are_ranked_by_coverage(self):
+        flour, sugar, salt = self.ingredients
+        both = self.create((flour, sugar))
+        all_three = self.create((flour, sugar, salt))
+        salty = self.create((salt,))
+        data = self.cookable((flour, sugar))
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(
+            [(recipe['id'], recipe['coverage']) for recipe in data['results']],
+            [(both, 1.0), (all_three, 0.667)]
+        )
+        self.assertEqual(
+            [item['id'] for item in data['results'][1]['missing_ingredients']],
+            [salt.id]
+        )
+        page = self.cookable((flour, salt), limit=1, page=2)
+        self.assertEqual(page['count'], 3)
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], [all_three]
+        )
+
+        self.client.patch(
+            reverse('api:recipes-detail', kwargs={'pk': both}),
+            self.recipe_data(self.tags, ((salt, 1),)),
+            format='json'
+        )
+        self.client.delete(reverse('api:recipes-detail', kwargs={'pk': salty}))
+        self.assertEqual(
+            [recipe['id'] for recipe in self.cookable((salt,))['results']],
+            [both, all_three]
+        )
+
+
+@override_settings(CACHES=CACHES)
+class RecipePaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@foodgram.ru', username='author',
+            password='secret', first_name='Author', last_name='Author'
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10, image='recipies/image/test.png'
+            ) for i in range(3)
+        )
+
+    def test_cursor_is_ignored_with_own_ordering(self):
+        url = reverse('api:recipes-list')
+        for query, keyset in (
+            ('?cursor=', True),
+            ('?cursor=&ordering=popular', False),
+            ('?cursor=&search=рецепт', False),
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(url + query)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual('count' not in response.data, keyset)
+        response = self.client.get(
+            reverse('api:recipes-trending') + '?cursor='
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('count', response.data)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=CACHES)
+class ImageRenditionTests(RecipeTestCase):
+    def create(self, image=IMAGE):
+        data = self.recipe_data(self.tags, ((self.ingredients[0], 1),))
+        data['image'] = image
+        response = self.client.post(
+            reverse('api:recipes-list'), data, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return reverse(
+            'api:recipes-detail', kwargs={'pk': response.data['id']}
+        )
+
+    def test_renditions_are_not_wider_than_source(self):
+        url = self.create()
+        images.process(images.claim())
+        renditions = self.client.get(url).data['image_renditions']
+        # Исходное изображение шириной 1 пиксель.
+        self.assertEqual(
+            {name: list(paths) for name, paths in renditions.items()},
+            {'webp': ['1'], 'jpeg': ['1']}
+        )
+        self.assertTrue(renditions['webp']['1'].endswith('/1.webp'))
+
+    def test_failed_processing_is_retried_without_renditions(self):
+        url = self.create(image_data('blue'))
+        recipe = Recipe.objects.get()
+        recipe.image.storage.delete(recipe.image.name)
+        images.process(images.claim())
+        job = ImageJob.objects.get()
+        self.assertEqual(job.status, ImageJob.PENDING)
+        self.assertIn('FileNotFoundError', job.error)
+        self.assertEqual(self.client.get(url).data['image_renditions'], {})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=CACHES)
+class CartTotalsTests(RecipeTestCase):
+    def create(self, amounts):
+        response = self.client.post(
+            reverse('api:recipes-list'),
+            self.recipe_data(self.tags, amounts),
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def request(self, method, name, pk, data=None):
+        # Кэши сбрасываются после фиксации транзакции, а тест идёт
+        # внутри неё.
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(
+                reverse(name, kwargs={'pk': pk}), data, format='json'
+            )
+
+    def summary(self):
+        data = self.client.get(
+            reverse('api:recipes-shopping-cart-summary')
+        ).data
+        return data['recipes_count'], [
+            (item['name'], item['measurement_unit'], item['amount'])
+            for item in data['ingredients']
+        ]
+
+    def test_totals_follow_cart_servings_and_recipe_changes(self):
+        flour, sugar, _ = self.ingredients
+        flour_kg = Ingredient.objects.create(
+            name='мука', measurement_unit='кг'
+        )
+        pancakes = self.create(((flour, 500), (sugar, 50)))
+        bread = self.create(((flour_kg, 1),))
+        cart = 'api:recipes-shopping-cart'
+
+        self.request('post', cart, pancakes, {'servings': 2})
+        self.assertEqual(
+            self.summary(), (1, [('мука', 'кг', 1), ('сахар', 'г', 100)])
+        )
+        self.request('post', cart, bread)
+        self.assertEqual(
+            self.summary(), (2, [('мука', 'кг', 2), ('сахар', 'г', 100)])
+        )
+        self.request('patch', cart, pancakes, {'servings': 1})
+        self.assertEqual(
+            self.summary(), (2, [('мука', 'г', 1500), ('сахар', 'г', 50)])
+        )
+        self.request('patch', 'api:recipes-detail', pancakes, {
+            'ingredients': [{'id': flour.id, 'amount': 700}]
+        })
+        self.assertEqual(self.summary(), (2, [('мука', 'г', 1700)]))
+        self.request('delete', cart, bread)
+        self.assertEqual(self.summary(), (1, [('мука', 'г', 700)]))
+        self.request('delete', 'api:recipes-detail', pancakes)
+        self.assertEqual(self.summary(), (0, []))
+
+
+@override_settings(CACHES=CACHES)
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def names(self, response):
+        return [item['name'] for item in response.data]
+
+    def test_etag_changes_with_catalog(self):
+        url = reverse('api:ingredients-list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Ingredient.objects.create(name='мёд', measurement_unit='г')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.names(response), ['мука', 'мёд'])
+
+    def test_version_bumped_by_another_process(self):
+        url = reverse('api:ingredients-list')
+        response = self.client.get(url, {'name': 'м'})
+        etag = response['ETag']
+        self.assertEqual(self.names(response), ['мука'])
+        # Так загружает справочник upload_json: без сигналов сохранения,
+        # версию он повышает в своём процессе.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='мёд', measurement_unit='г')]
+        )
+        subprocess.run(
+            (
+                sys.executable, 'manage.py', 'shell', '-c',
+                'from api.caching import bump_catalog_version; '
+                'from recipes.models import Ingredient; '
+                'bump_catalog_version(Ingredient)'
+            ),
+            cwd=settings.BASE_DIR, check=True,
+            env={
+                **os.environ,
+                'CACHE_BACKEND': CACHES['default']['BACKEND'],
+                'CACHE_LOCATION': CACHES['default']['LOCATION'],
+            }
+        )
+        response = self.client.get(url, {'name': 'м'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.names(response), ['мука', 'мёд'])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+    }})
+    def test_no_etag_with_process_local_cache(self):
+        url = reverse('api:ingredients-list')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='мёд', measurement_unit='г')]
+        )
+        self.assertEqual(
+            self.names(self.client.get(url, {'name': 'м'})), ['мука', 'мёд']
+        )
+
+
+@override_settings(CACHES=CACHES)
+class TokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='cook@foodgram.ru', username='cook', password='secret',
+            first_name='Cook', last_name='Cook'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def me(self):
+        return self.client.get(reverse('api:users-me')).status_code
+
+    def test_logout_revokes_cached_token(self):
+        self.assertEqual(self.me(), status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(), status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('api:logout'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.me(), status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.assertEqual(self.me(), status.HTTP_200_OK)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.me(), status.HTTP_401_UNAUTHORIZED)
+
+    def test_lookup_racing_with_logout_is_not_cached(self):
+        lookup = TokenAuthentication.authenticate_credentials
+
+        def racing_lookup(auth, key):
+            # Выход завершается, пока запрос читает токен из базы.
+            user, token = lookup(auth, key)
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate_token(key)
+            return user, token
+
+        with mock.patch.object(
+            TokenAuthentication, 'authenticate_credentials', racing_lookup
+        ):
+            self.assertEqual(self.me(), status.HTTP_200_OK)
+        Token.objects.filter(pk=self.token.pk).update(key='revoked')
+        self.assertEqual(self.me(), status.HTTP_401_UNAUTHORIZED)
@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
 from . import views
+from .metrics import metrics
 
 app_name = 'api'
 
@@ -12,7 +14,11 @@ router.register("tags", views.TagViewSet, basename="tags")
 router.register('ingredients', views.IngredientViewSet, basename='ingredients')
 router.register('recipes', views.RecipeViewSet, basename='recipes')
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
     path("", include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken'))
 ]
+if settings.ASYNC_VIEWS:
+    from .async_views import urlpatterns as async_urlpatterns
+    urlpatterns = async_urlpatterns + urlpatterns
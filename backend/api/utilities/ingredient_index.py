@@ -0,0 +1,56 @@
+from bisect import bisect_left
+from threading import Lock
+
+from recipes.models import Ingredient
+from ..caching import get_catalog_version
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Строится при первом обращении и перестраивается, когда меняется
+    версия справочника ингредиентов в общем кэше (её повышают сигналы
+    сохранения и удаления в любом процессе и команда upload_json).
+    Поиск по префиксу не обращается к базе. С кэшем в памяти процесса
+    индекс не используется.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = None
+        self._rows = None
+
+    def _load(self):
+        version = get_catalog_version(Ingredient)
+        with self._lock:
+            if self._version == version:
+                return self._keys, self._rows
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id'])
+        )
+        keys = [row['name'].casefold() for row in rows]
+        with self._lock:
+            # Версия прочитана до выборки: если справочник изменился во
+            # время построения, следующий вызов перестроит индекс снова.
+            self._version, self._keys, self._rows = version, keys, rows
+        return keys, rows
+
+    def all(self):
+        _, rows = self._load()
+        return sorted(rows, key=lambda row: row['id'])
+
+    def search(self, prefix):
+        """Ингредиенты, название которых начинается с prefix
+        без учёта регистра, в порядке id, как при выборке из базы."""
+        keys, rows = self._load()
+        prefix = prefix.strip().casefold()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return sorted(rows[start:end], key=lambda row: row['id'])
+
+
+ingredient_index = IngredientIndex()
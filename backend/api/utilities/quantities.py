@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+# Единица измерения: (базовая единица, сколько базовых в одной).
+UNITS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('ч. л.', 1),
+    'ст. л.': ('ч. л.', 3),
+}
+# Базовая единица: единицы её семейства от крупной к мелкой.
+DISPLAY_UNITS = {
+    base: sorted(
+        (
+            (unit, factor) for unit, (family, factor) in UNITS.items()
+            if family == base
+        ),
+        key=lambda item: -item[1]
+    )
+    for base, _ in UNITS.values()
+}
+
+
+def to_display(base, amount):
+    """Крупнейшая единица семейства, в которой количество целое."""
+    for unit, factor in DISPLAY_UNITS.get(base, ((base, 1),)):
+        if amount % factor == 0:
+            return unit, amount // factor
+    return base, amount
+
+
+def merge_quantities(rows):
+    """Сводит строки (название, единица, количество) в одну строку на
+    название и семейство совместимых единиц.
+
+    Количества переводятся в базовую единицу по таблице UNITS за один
+    проход, несовместимые единицы остаются отдельными строками.
+    """
+    totals = defaultdict(int)
+    for name, unit, amount in rows:
+        base, factor = UNITS.get(unit, (unit, 1))
+        totals[name, base] += amount * factor
+    return [
+        (name, *to_display(base, amount))
+        for (name, base), amount in sorted(totals.items())
+        if amount > 0
+    ]
@@ -0,0 +1,149 @@
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import CartTotal
+from ..metrics import cache_lookup, measure_pdf
+from ..profiling import timed
+from .quantities import merge_quantities
+
+FONT = "DejaVuSerif"
+FONT_PATH = os.path.join(settings.BASE_DIR, "DejaVuSerif.ttf")
+PAGE_TOP = 800
+PAGE_BOTTOM = 40
+ITEM_HEIGHT = 60
+
+
+def get_shopping_list(user):
+    """Список покупок из готовых итогов корзины пользователя.
+
+    Совместимые единицы одного ингредиента сводятся в одну строку.
+    Возвращает список кортежей (название, единица измерения, количество),
+    общий для всех форматов выгрузки.
+    """
+    return merge_quantities(
+        CartTotal.objects.filter(user=user).values_list(
+            "ingredient__name", "ingredient__measurement_unit", "amount"
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Разбирает файл шрифта один раз за время жизни процесса."""
+    pdfmetrics.registerFont(TTFont(FONT, FONT_PATH))
+    return FONT
+
+
+@measure_pdf
+@timed("pdf")
+def build_pdf(rows, creation_date):
+    font = register_font()
+    buffer = BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+
+    data = {}
+    for name, unit, amount in rows:
+        data.setdefault(name, {})[unit] = amount
+    page.setFont(font, 15, leading=None)
+    page.setFillColorRGB(0.29296875, 0.453125, 0.609375)
+    page.drawString(260, PAGE_TOP, "Список ингредиентов")
+    page.line(0, 780, 1000, 780)
+    page.line(0, 778, 1000, 778)
+    x1 = 20
+    y1 = 750
+    for key, value in data.items():
+        for index, (unit, amount) in enumerate(value.items()):
+            if y1 - ITEM_HEIGHT < PAGE_BOTTOM:
+                page.showPage()
+                page.setFillColorRGB(0.29296875, 0.453125, 0.609375)
+                y1 = PAGE_TOP
+            if not index:
+                page.setFont(font, 15, leading=None)
+                page.drawString(x1, y1 - 12, f"{key}")
+            page.setFont(font, 10, leading=None)
+            page.drawString(x1, y1 - 30, f"{unit} - {amount}")
+            y1 = y1 - ITEM_HEIGHT
+    page.setTitle(f"Отправлено {creation_date}")
+    page.showPage()
+    page.save()
+    return buffer.getvalue()
+
+
+def render_pdf(rows, creation_date):
+    yield build_pdf(rows, creation_date)
+
+
+def render_csv(rows, creation_date):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("name", "measurement_unit", "amount"))
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def render_txt(rows, creation_date):
+    yield f"Список ингредиентов от {creation_date}\n\n".encode()
+    for name, unit, amount in rows:
+        yield f"{name} ({unit}) - {amount}\n".encode()
+
+
+def render_json(rows, creation_date):
+    yield b"["
+    for index, (name, unit, amount) in enumerate(rows):
+        item = json.dumps(
+            {"name": name, "measurement_unit": unit, "amount": amount},
+            ensure_ascii=False
+        )
+        yield f"{',' if index else ''}{item}".encode()
+    yield b"]"
+
+
+RENDERERS = {
+    "pdf": render_pdf,
+    "csv": render_csv,
+    "txt": render_txt,
+    "json": render_json,
+}
+
+
+def _cache_chunks(key, chunks):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, b"".join(parts), settings.SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def make_shopping_list(rows, file_format):
+    """Возвращает итератор по байтам списка покупок в нужном формате.
+
+    Готовый файл кэшируется по хэшу агрегированных строк, поэтому
+    повторная загрузка неизменной корзины не формирует его заново.
+    При промахе кэша файл отдаётся по частям по мере формирования.
+    """
+    creation_date = datetime.today().strftime("%Y-%m-%d")
+    digest = hashlib.sha256(
+        json.dumps(rows, ensure_ascii=False).encode()
+    ).hexdigest()
+    key = f"shopping-list:{file_format}:{creation_date}:{digest}"
+    content = cache.get(key)
+    cache_lookup("shopping_list", content is not None)
+    if content is not None:
+        return iter((content,))
+    return _cache_chunks(key, RENDERERS[file_format](rows, creation_date))
@@ -1,32 +1,42 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Subquery, Sum
-from django.http import FileResponse
+from django.db.models import (
+    BooleanField, F, Prefetch, Value, prefetch_related_objects
+)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import viewsets, status
 
 from recipes.models import (
-    Tag, Ingredient, Recipe, Favorite, ShoppingCart, RecipeAmount)
+    Tag, Ingredient, IngredientPosting, Recipe, RecipeAmount,
+    Favorite, ShoppingCart
+)
 from users.models import Follow
+from .caching import CatalogCacheMixin, cache_is_shared, get_membership
 from .filters import IngredientFilter, RecipeFilter
 from .serializers import (
     UserSerializer, TagSerializer, IngredientSerializer,
-    RecipeReadSerializer, RecipeWriteSerializer, FavoriteSerializer,
-    ShoppingCartSerializer, SubsctiptionListSerializer)
+    CookableRecipeSerializer, RecipeReadSerializer, RecipeWriteSerializer,
+    FavoriteSerializer, ShoppingCartSerializer, SubsctiptionListSerializer)
 from .pagination import CustomPagination
 from .permissions import IsAuthorPermission
-from .utilities.download_pdf import make_pdf
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .utilities.shopping_list import get_shopping_list, make_shopping_list
+from .utilities.ingredient_index import ingredient_index
 
 
 User = get_user_model()
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalog_model = Ingredient
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
@@ -34,8 +44,22 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ('^name', )
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        not_modified = self.not_modified(request)
+        if not_modified:
+            return not_modified
+        if not cache_is_shared():
+            # Без общей версии справочника индекс не узнает об
+            # изменениях из других процессов.
+            return super().list(request, *args, **kwargs)
+        name = request.query_params.get(IngredientFilter.search_param)
+        if name is None:
+            return Response(ingredient_index.all())
+        return Response(ingredient_index.search(name))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalog_model = Tag
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
@@ -50,24 +74,82 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     queryset = Recipe.objects.all()
     filter_fields = ('is_favorite', 'is_in_shopping_cart')
+    cursor_ordering = ('-pub_date', '-id')
+
+    def get_queryset(self):
+        return Recipe.objects.with_related()
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
-    @action(detail=False, methods=["GET"])
+    @action(detail=False, methods=["GET"], cursor_ordering=None)
+    def trending(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).trending()
+        pages = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(pages, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=["GET"], cursor_ordering=None)
+    def cookable(self, request):
+        values = request.query_params.getlist('ingredients')
+        if not values or not all(value.isdigit() for value in values):
+            raise ValidationError(
+                {'ingredients': 'Укажите id имеющихся ингредиентов!'}
+            )
+        available = {int(value) for value in values}
+        ranked = IngredientPosting.objects.rank(available)
+        page = self.paginate_queryset(ranked)
+        recipes = Recipe.objects.prefetch_related(Prefetch(
+            'ingredients',
+            queryset=RecipeAmount.objects.exclude(
+                ingredient__in=available
+            ).select_related('ingredient')
+        )).in_bulk([pk for pk, _ in page])
+        results = []
+        for pk, coverage in page:
+            recipe = recipes[pk]
+            recipe.coverage = round(coverage, 3)
+            recipe.missing_ingredients = [
+                amount.ingredient for amount in recipe.ingredients.all()
+            ]
+            results.append(recipe)
+        serializer = CookableRecipeSerializer(results, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            PDFRenderer, JSONRenderer, CSVRenderer, PlainTextRenderer
+        ]
+    )
     def download_shopping_cart(self, request):
-        recipes_in_cart = ShoppingCart.objects.filter(user=request.user)
-        ingredients = RecipeAmount.objects.filter(
-            recipe__in=Subquery(recipes_in_cart.values("pk"))
-        ).order_by("ingredient__name").values(
-            "ingredient__name", "ingredient__measurement_unit"
-        ).annotate(amount=Sum("amount"))
-        return FileResponse(
-            make_pdf(ingredients),
-            as_attachment=True,
-            filename='shopping_cart.pdf')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            make_shopping_list(get_shopping_list(request.user),
+                               renderer.format),
+            content_type=(
+                f'{renderer.media_type}; charset={renderer.charset}'
+                if renderer.charset else renderer.media_type
+            )
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
+        return response
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def shopping_cart_summary(self, request):
+        return Response({
+            'recipes_count': len(get_membership(request).shopping_cart),
+            'ingredients': [
+                {'name': name, 'measurement_unit': unit, 'amount': amount}
+                for name, unit, amount in get_shopping_list(request.user)
+            ]
+        })
 
     @action(
         detail=True,
@@ -108,11 +190,27 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'user': request.user.id,
             'recipe': recipe.id
         }
+        if 'servings' in request.data:
+            data['servings'] = request.data['servings']
         serializer = ShoppingCartSerializer(data=data, context=context)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
+    @shopping_cart.mapping.patch
+    def update_shopping_cart(self, request, pk):
+        cart = get_object_or_404(
+            ShoppingCart,
+            user=request.user,
+            recipe=get_object_or_404(Recipe, id=pk))
+        serializer = ShoppingCartSerializer(
+            cart, data={'servings': request.data.get('servings')},
+            partial=True, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
     @shopping_cart.mapping.delete
     def destroy_shopping_cart(self, request, pk):
         get_object_or_404(
@@ -126,6 +224,7 @@ class UserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = CustomPagination
+    cursor_ordering = None
 
     @action(
         methods=['post', 'delete'],
@@ -149,11 +248,26 @@ class UserViewSet(UserViewSet):
             ).delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        cursor_ordering='-follow_id'
+    )
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(following__user=user)
+        queryset = User.objects.filter(following__user=user).annotate(
+            follow_id=F('following__id'),
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('-follow_id')
         pages = self.paginate_queryset(queryset)
+        limit = request.query_params.get('recipes_limit')
+        if pages and (not limit or limit.isdigit()):
+            recipes = Recipe.objects.all()
+            if limit:
+                recipes = recipes.latest_per_author(
+                    [author.id for author in pages], int(limit)
+                )
+            prefetch_related_objects(pages, Prefetch('recipes', recipes))
         serializer = SubsctiptionListSerializer(
             pages, many=True, context={"request": request}
         )
@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# Соединения ASGI открываются в разных потоках и не переиспользуются
+# между запросами, поэтому здесь по умолчанию работает пул.
+os.environ.setdefault('DB_POOL', 'true')
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
@@ -0,0 +1,206 @@
+import threading
+import time
+from collections import deque
+
+from django.db.backends.postgresql import base, creation
+from django.db.utils import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from api.metrics import DB_POOL_CONNECTIONS, DB_POOL_SIZE
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений psycopg2.
+
+    Свободные соединения выдаются в обратном порядке, чтобы чаще
+    использовались уже прогретые. Соединение, простоявшее дольше
+    check_after секунд, перед выдачей проверяется запросом SELECT 1,
+    а прожившее дольше max_lifetime - закрывается. Размер пула и число
+    выданных и свободных соединений отдаются в метриках с меткой alias.
+    """
+
+    def __init__(self, size, timeout, check_after, max_lifetime,
+                 alias='default'):
+        self.size = size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        self.alias = alias
+        self.closed = False
+        self.opened = 0
+        self._created = {}
+        self._idle = deque()
+        self._condition = threading.Condition()
+        DB_POOL_SIZE.labels(alias).set(size)
+        self._report()
+
+    def _report(self):
+        """Обновляет метрики; вызывается под self._condition."""
+        if self.closed:
+            # Метки alias уже принадлежат пулу, который его заменил.
+            return
+        idle = len(self._idle)
+        DB_POOL_CONNECTIONS.labels(self.alias, 'idle').set(idle)
+        DB_POOL_CONNECTIONS.labels(self.alias, 'in_use').set(
+            self.opened - idle
+        )
+
+    def acquire(self, connect):
+        while True:
+            item = self._take()
+            if item is None:
+                return self._open(connect)
+            connection, released = item
+            now = time.monotonic()
+            if now - self._created[connection] >= self.max_lifetime or (
+                now - released >= self.check_after
+                and not self._is_usable(connection)
+            ):
+                self.discard(connection)
+                continue
+            return connection
+
+    def _take(self):
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while not self._idle and self.opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise OperationalError(
+                        f'Нет свободных соединений в пуле за '
+                        f'{self.timeout} с'
+                    )
+            try:
+                if self._idle:
+                    return self._idle.pop()
+                self.opened += 1
+                return None
+            finally:
+                self._report()
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self.opened -= 1
+                self._report()
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created[connection] = time.monotonic()
+        return connection
+
+    @staticmethod
+    def _is_usable(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def release(self, connection):
+        if not connection.closed and (
+            connection.get_transaction_status() != TRANSACTION_STATUS_IDLE
+        ):
+            try:
+                connection.rollback()
+            except Exception:
+                pass
+        if self.closed or connection.closed or (
+            connection.get_transaction_status() != TRANSACTION_STATUS_IDLE
+        ):
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._report()
+            self._condition.notify()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._condition:
+            self._created.pop(connection, None)
+            self.opened -= 1
+            self._report()
+            self._condition.notify()
+
+    def close(self):
+        """Закрывает свободные соединения пула, выданные закрываются
+        при возврате."""
+        with self._condition:
+            self.closed = True
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self.discard(connection)
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Свободные соединения пула к тестовой базе не дали бы её удалить.
+        self.connection.pool.close()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с пулом соединений, общим для потоков процесса.
+
+    Закрытие соединения Django возвращает его в пул, поэтому пул
+    используется с CONN_MAX_AGE = 0. Параметры берутся из ключа POOL
+    настроек базы: SIZE, TIMEOUT, CHECK_AFTER и MAX_LIFETIME.
+    """
+    creation_class = DatabaseCreation
+    # Алиас: параметры соединения и пул.
+    pools = {}
+    pools_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        return self.get_pool(self.get_connection_params())
+
+    def get_pool(self, conn_params):
+        """Пул алиаса для параметров соединения.
+
+        Если параметры изменились, например create_test_db сменил NAME,
+        прежний пул закрывается, и его соединения больше не выдаются.
+        """
+        params = repr(sorted(conn_params.items()))
+        with self.pools_lock:
+            pool_params, pool = self.pools.get(self.alias, (None, None))
+            if pool_params != params or pool.closed:
+                if pool is not None:
+                    pool.close()
+                options = self.settings_dict.get('POOL', {})
+                pool = ConnectionPool(
+                    size=options.get('SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10),
+                    check_after=options.get('CHECK_AFTER', 30),
+                    max_lifetime=options.get('MAX_LIFETIME', 60 * 30),
+                    alias=self.alias
+                )
+                self.pools[self.alias] = (params, pool)
+            return pool
+
+    def get_new_connection(self, conn_params):
+        def connect():
+            return super(DatabaseWrapper, self).get_new_connection(
+                conn_params
+            )
+
+        self.connection_pool = self.get_pool(conn_params)
+        connection = self.connection_pool.acquire(connect)
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.release(self.connection)
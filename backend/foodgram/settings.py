@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -80,7 +83,45 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='localhost'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60 * 10)),
+    }
+}
+# Соединение, простоявшее без запросов дольше этого числа секунд,
+# проверяется в начале следующего запроса.
+DB_CONN_HEALTH_CHECK_AFTER = int(
+    os.getenv('DB_CONN_HEALTH_CHECK_AFTER', default=30)
+)
+# Асинхронные представления чтения рецептов и справочников и число
+# потоков для их работы с базой; asgi.py включает их по умолчанию.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='').lower() in (
+    '1', 'true', 'yes'
+)
+ASYNC_VIEW_THREADS = int(os.getenv('ASYNC_VIEW_THREADS', default=10))
+# Пул соединений процесса; asgi.py включает его по умолчанию.
+if (
+    os.getenv('DB_POOL', default='').lower() in ('1', 'true', 'yes')
+    and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+):
+    DATABASES['default'].update({
+        'ENGINE': 'foodgram.pooled_postgresql',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'SIZE': int(os.getenv('DB_POOL_SIZE', default=10)),
+            'TIMEOUT': int(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'CHECK_AFTER': DB_CONN_HEALTH_CHECK_AFTER,
+        },
+    })
+
+# Кэш должен быть общим для всех процессов, включая команды manage.py:
+# через него расходятся версии справочников и сброс кэшей пользователя.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='/tmp/foodgram-cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+        },
     }
 }
 
@@ -135,7 +176,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
 }
@@ -165,3 +206,38 @@ UNIVERSAL_FIELD_LENGTH = 150
 RECIPE_NAME_LENGTH = 200
 MIN_AMOUNT_VALUE = 1
 MAX_AMOUNT_VALUE = 1441
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', default=60))
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=30))
+AUTH_TOKEN_SHARED_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_SHARED_CACHE_TIMEOUT', default=60 * 5)
+)
+SEARCH_CONFIG = 'russian'
+IMAGE_RENDITION_WIDTHS = (320, 640, 1280)
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_RETRY_DELAY = 60
+IMAGE_JOB_STALE_AFTER = 60 * 10
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', default='').lower() in (
+    '1', 'true', 'yes'
+)
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=1))
+PROFILING_SLOW_MS = float(os.getenv('PROFILING_SLOW_MS', default=500))
+PROFILING_DUMP_DIR = os.getenv('PROFILING_DUMP_DIR', default='')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+# Каталог, через который процессы gunicorn делятся метриками Prometheus.
+# Должен быть задан до запуска рабочих процессов.
+METRICS_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/foodgram-metrics'
+)
+
+
+def on_starting(server):
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.makedirs(METRICS_DIR)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
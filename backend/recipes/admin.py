@@ -1,8 +1,8 @@
 from django.contrib import admin
 
 from .models import (
-    Recipe, Ingredient, Tag, Favorite,
-    ShoppingCart, RecipeAmount)
+    CartTotal, Recipe, Ingredient, IngredientPosting, ImageJob, Tag, Favorite,
+    ShoppingCart, RecipeAmount, RecipeScore)
 
 
 class RecipeAmountInline(admin.TabularInline):
@@ -21,8 +21,16 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeAmountInline, )
 
     def get_favorite(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
     get_favorite.short_description = 'Избранные рецепты'
+    get_favorite.admin_order_field = 'favorites_count'
+
+    def save_related(self, request, form, formsets, change):
+        old = form.instance.ingredients.totals()
+        super().save_related(request, form, formsets, change)
+        new = form.instance.ingredients.totals()
+        IngredientPosting.objects.replace(form.instance.pk, old, new)
+        CartTotal.objects.update_recipe(form.instance.pk, old, new)
 
 
 @admin.register(Ingredient)
@@ -47,4 +55,20 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     """Интерфейс управления корзинами."""
-    list_display = ('user', 'recipe')
+    list_display = ('user', 'recipe', 'servings')
+
+
+@admin.register(RecipeScore)
+class RecipeScoreAdmin(admin.ModelAdmin):
+    """Интерфейс просмотра рейтинга рецептов."""
+    list_display = ('recipe', 'score', 'updated')
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    """Интерфейс просмотра очереди обработки изображений."""
+    list_display = ('recipe', 'source', 'status', 'attempts', 'created')
+    list_filter = ('status', )
+    readonly_fields = (
+        'recipe', 'source', 'attempts', 'error', 'created', 'started'
+    )
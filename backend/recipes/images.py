@@ -0,0 +1,137 @@
+import os
+import traceback
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ImageJob, Recipe
+from .storage import IdempotentStorage
+
+RENDITIONS_DIR = 'recipies/renditions'
+rendition_storage = IdempotentStorage()
+# Формат в JSON, формат Pillow и параметры сохранения.
+RENDITION_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def enqueue(recipe):
+    """Ставит изображение рецепта в очередь, если его копии ещё не
+    готовятся."""
+    source = recipe.image.name
+    if not ImageJob.objects.filter(
+        recipe=recipe, source=source,
+        status__in=(ImageJob.PENDING, ImageJob.RUNNING)
+    ).exists():
+        ImageJob.objects.create(recipe=recipe, source=source)
+
+
+def encode(image, pillow_format, options):
+    if pillow_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def make_renditions(source):
+    """Сохраняет копии изображения нужной ширины в WebP и JPEG.
+
+    Метаданные (EXIF, ICC, комментарии) не переносятся, ориентация
+    из EXIF применяется к пикселям. Копии шире оригинала не создаются.
+    """
+    with Recipe.image.field.storage.open(source) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    image.info = {}
+    widths = sorted({
+        min(width, image.width) for width in settings.IMAGE_RENDITION_WIDTHS
+    })
+    renditions = {'source': source}
+    for width in widths:
+        height = max(round(image.height * width / image.width), 1)
+        resized = None
+        for name, pillow_format, options in RENDITION_FORMATS:
+            path = f'{renditions_dir(source)}/{width}.{name}'
+            # Копии одинаковых изображений уже лежат по тому же пути.
+            if not rendition_storage.exists(path):
+                if resized is None:
+                    resized = image.resize((width, height), Image.LANCZOS)
+                rendition_storage.save(
+                    path, encode(resized, pillow_format, options)
+                )
+            renditions.setdefault(name, {})[str(width)] = path
+    return renditions
+
+
+def renditions_dir(source):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'{RENDITIONS_DIR}/{stem}'
+
+
+def rendition_paths(renditions):
+    return {
+        path
+        for name, _, _ in RENDITION_FORMATS
+        for path in renditions.get(name, {}).values()
+    }
+
+
+def claim():
+    """Забирает следующее задание.
+
+    Упавшее задание повторяется не раньше чем через IMAGE_JOB_RETRY_DELAY,
+    зависшее дольше IMAGE_JOB_STALE_AFTER выдаётся другому обработчику.
+    """
+    now = timezone.now()
+    retry = now - timedelta(seconds=settings.IMAGE_JOB_RETRY_DELAY)
+    stale = now - timedelta(seconds=settings.IMAGE_JOB_STALE_AFTER)
+    with transaction.atomic():
+        job = ImageJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ImageJob.PENDING, started__isnull=True)
+            | Q(status=ImageJob.PENDING, started__lt=retry)
+            | Q(status=ImageJob.RUNNING, started__lt=stale)
+        ).order_by('created').first()
+        if job is None:
+            return None
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=ImageJob.RUNNING,
+            attempts=F('attempts') + 1,
+            started=timezone.now()
+        )
+    job.refresh_from_db()
+    return job
+
+
+def process(job):
+    if not Recipe.objects.filter(pk=job.recipe_id, image=job.source).exists():
+        # Изображение заменили, копии подготовит следующее задание.
+        ImageJob.objects.filter(pk=job.pk).update(status=ImageJob.DONE)
+        return
+    try:
+        renditions = make_renditions(job.source)
+    except Exception:
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=(
+                ImageJob.FAILED
+                if job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS
+                else ImageJob.PENDING
+            ),
+            error=traceback.format_exc()
+        )
+        return
+    Recipe.objects.filter(pk=job.recipe_id, image=job.source).update(
+        image_renditions=renditions
+    )
+    ImageJob.objects.filter(pk=job.pk).update(
+        status=ImageJob.DONE, error=''
+    )
@@ -0,0 +1,115 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import (
+    RENDITIONS_DIR, rendition_paths, rendition_storage, renditions_dir
+)
+from recipes.models import MediaFile, Recipe
+
+
+def walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from walk(storage, f'{directory}/{name}')
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения рецептов, на которые не осталось ссылок, '
+            'вместе с их уменьшенными копиями')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=float, default=24.0,
+            help='Не трогать файлы, использованные за последние N часов'
+        )
+        parser.add_argument(
+            '--scan', action='store_true',
+            help='Дополнительно обойти каталоги и удалить неучтённые файлы'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def handle(self, *args, **kwargs):
+        self.verbosity = kwargs['verbosity']
+        self.dry_run = kwargs['dry_run']
+        self.storage = Recipe.image.field.storage
+        self.cutoff = timezone.now() - timedelta(hours=kwargs['grace'])
+        self.deleted = set()
+        self.reclaimed = 0
+        self.collect_orphans()
+        if kwargs['scan']:
+            self.scan()
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if self.dry_run else "Удалено"} файлов: '
+            f'{len(self.deleted)}, {self.reclaimed / 2 ** 20:.1f} МБ'
+        ))
+
+    def is_recent(self, storage, name):
+        return storage.get_modified_time(name) >= self.cutoff
+
+    def delete(self, storage, name):
+        if name in self.deleted:
+            return
+        self.deleted.add(name)
+        self.reclaimed += storage.size(name)
+        if self.verbosity > 1:
+            self.stdout.write(name)
+        if not self.dry_run:
+            storage.delete(name)
+
+    def collect_orphans(self):
+        orphans = MediaFile.objects.filter(
+            references=0, released__lt=self.cutoff
+        ).values_list('name', flat=True)
+        for name in orphans.iterator():
+            exists = self.storage.exists(name)
+            # Файл могли загрузить повторно, пока ссылка ещё не записана.
+            if exists and self.is_recent(self.storage, name):
+                continue
+            if not self.dry_run and not MediaFile.objects.filter(
+                name=name, references=0
+            ).delete()[0]:
+                continue
+            if exists:
+                self.delete(self.storage, name)
+            directory = renditions_dir(name)
+            for path in walk(rendition_storage, directory):
+                self.delete(rendition_storage, path)
+            if not self.dry_run and rendition_storage.exists(directory):
+                try:
+                    os.rmdir(rendition_storage.path(directory))
+                except OSError:
+                    pass
+
+    def scan(self):
+        images = set(Recipe.objects.values_list('image', flat=True))
+        images.update(MediaFile.objects.filter(
+            references__gt=0
+        ).values_list('name', flat=True))
+        directories = {renditions_dir(name) for name in images}
+        renditions = set()
+        for value in Recipe.objects.values_list(
+            'image_renditions', flat=True
+        ).iterator():
+            renditions.update(rendition_paths(value))
+
+        field = Recipe._meta.get_field('image')
+        for name in walk(self.storage, field.upload_to):
+            if name not in images and not self.is_recent(self.storage, name):
+                self.delete(self.storage, name)
+        for name in walk(rendition_storage, RENDITIONS_DIR):
+            if (
+                name not in renditions
+                and name.rsplit('/', 1)[0] not in directories
+                and not self.is_recent(rendition_storage, name)
+            ):
+                self.delete(rendition_storage, name)
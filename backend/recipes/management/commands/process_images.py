@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.images import claim, process
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает очередь изображений рецептов: готовит копии '
+            'в WebP и JPEG нескольких размеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Число параллельных обработчиков'
+        )
+        parser.add_argument(
+            '--poll', type=float, default=2.0,
+            help='Пауза между проверками пустой очереди, в секундах'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и завершиться'
+        )
+
+    def handle(self, *args, **kwargs):
+        self.verbosity = kwargs['verbosity']
+        with ThreadPoolExecutor(max_workers=kwargs['workers']) as pool:
+            done = sum(pool.map(
+                lambda _: self.work(kwargs['poll'], kwargs['once']),
+                range(kwargs['workers'])
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано заданий: {done}'
+        ))
+
+    def work(self, poll, once):
+        done = 0
+        try:
+            while True:
+                job = claim()
+                if job is None:
+                    if once:
+                        return done
+                    time.sleep(poll)
+                    continue
+                process(job)
+                done += 1
+                if self.verbosity > 1:
+                    self.stdout.write(f'{job.source}: попытка {job.attempts}')
+        finally:
+            connection.close()
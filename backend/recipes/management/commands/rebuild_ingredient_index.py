@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import IngredientPosting
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает обратный индекс ингредиентов для подбора '
+            'рецептов по имеющимся продуктам')
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        start = time.perf_counter()
+        IngredientPosting.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс пересобран для {IngredientPosting.objects.count()} '
+            f'ингредиентов за {time.perf_counter() - start:.2f} с'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import CartTotal, Favorite, Recipe, RecipeAmount
+from users.models import Follow, User
+
+
+class Command(BaseCommand):
+    # Поле-счётчик, модель связанных строк и её внешний ключ на владельца.
+    COUNTERS = (
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+        (Recipe, 'ingredients_count', RecipeAmount, 'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'followers_count', Follow, 'author'),
+    )
+    help = ('Пересчитывает денормализованные счётчики и итоги корзин, '
+            'исправляет расхождения')
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        for model, field, related, key in self.COUNTERS:
+            actual = Coalesce(Subquery(
+                related.objects.filter(**{key: OuterRef('pk')}).order_by()
+                .values(key).annotate(total=Count('pk')).values('total')
+            ), 0)
+            drifted = list(
+                model.objects.select_for_update().annotate(actual=actual)
+                .exclude(**{field: F('actual')}).only('pk', field)
+            )
+            for obj in drifted:
+                setattr(obj, field, obj.actual)
+            model.objects.bulk_update(drifted, (field,), batch_size=1000)
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: '
+                f'исправлено {len(drifted)}'
+            )
+        CartTotal.objects.rebuild()
+        self.stdout.write('Итоги корзин пересчитаны')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
@@ -1,32 +1,135 @@
+import csv
 import json
+import os
+import time
+from itertools import islice
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.caching import bump_catalog_version
 from recipes.models import Ingredient, Tag
 
+READ_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """Построчно читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    opened = False
+    while True:
+        while position < len(buffer) and (
+            buffer[position].isspace() or opened and buffer[position] == ','
+        ):
+            position += 1
+        if position < len(buffer) and not opened:
+            if buffer[position] != '[':
+                raise CommandError('Файл должен содержать массив объектов')
+            position += 1
+            opened = True
+            continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON в конце файла')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if not isinstance(obj, dict):
+            raise CommandError(f'Ожидается объект, получено: {obj!r}')
+        yield obj
+        position = end
+
+
+def iter_csv(file, fields):
+    for number, row in enumerate(csv.reader(file), start=1):
+        if not row:
+            continue
+        if len(row) != len(fields):
+            raise CommandError(
+                f'Строка {number}: ожидается {len(fields)} столбца(ов)'
+            )
+        yield dict(zip(fields, row))
+
 
 class Command(BaseCommand):
     MODELS = {
         "i": Ingredient,
         "t": Tag
     }
-    help = 'Загружает данные из .json и формирует модель'
+    # Поля модели в порядке столбцов data/*.csv, файлы идут без заголовка.
+    FIELDS = {
+        Ingredient: ('name', 'measurement_unit'),
+        Tag: ('name', 'color', 'slug'),
+    }
+    help = 'Загружает данные из .json или .csv и формирует модель'
 
     def add_arguments(self, parser):
         parser.add_argument('path', type=str)
         group = parser.add_mutually_exclusive_group()
         group.add_argument('-t', action="store_true")
         group.add_argument("-i", action="store_true")
+        parser.add_argument('--batch-size', type=int, default=1000)
 
     def handle(self, *args, **kwargs):
         path = kwargs['path']
         flag = "t" if kwargs["t"] else "i"
         model = self.MODELS[flag]
+        self.verbosity = kwargs['verbosity']
+        start = time.perf_counter()
         try:
-            with open(path, 'rt', encoding='utf-8') as file:
-                data = json.loads(file.read())
-                for attrs in data:
-                    model.objects.get_or_create(**attrs)
+            with open(path, 'rt', encoding='utf-8', newline='') as file:
+                if os.path.splitext(path)[1].lower() == '.csv':
+                    rows = iter_csv(file, self.FIELDS[model])
+                else:
+                    rows = iter_json(file)
+                total, inserted = self.load(
+                    model, rows, kwargs['batch_size']
+                )
+        except CommandError:
+            raise
         except Exception as exc:
             raise (CommandError(exc))
+        bump_catalog_version(model)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные загружены: строк {total}, добавлено {inserted}, '
+            f'пропущено {total - inserted}, '
+            f'{total / elapsed if elapsed else total:.0f} строк/с'
+        ))
+
+    def validate(self, model, obj, number):
+        # Валидаторы полей модели не применяются: справочник содержит
+        # единицы вида "по вкусу", которые загружались и раньше.
+        for name in self.FIELDS[model]:
+            value = getattr(obj, name)
+            max_length = model._meta.get_field(name).max_length
+            if not isinstance(value, str) or not value.strip():
+                raise CommandError(f'Строка {number}: не заполнено {name}')
+            if len(value) > max_length:
+                raise CommandError(
+                    f'Строка {number}: {name} длиннее {max_length} символов'
+                )
 
-        self.stdout.write(self.style.SUCCESS('Данные загружены'))
+    @transaction.atomic
+    def load(self, model, rows, batch_size):
+        before = model.objects.count()
+        total = 0
+        while True:
+            batch = [model(**attrs) for attrs in islice(rows, batch_size)]
+            if not batch:
+                break
+            for number, obj in enumerate(batch, start=total + 1):
+                self.validate(model, obj, number)
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+            if self.verbosity > 1:
+                self.stdout.write(f'Обработано строк: {total}')
+        return total, model.objects.count() - before
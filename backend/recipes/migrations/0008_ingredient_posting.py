@@ -0,0 +1,55 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:06
+
+import django.contrib.postgres.fields
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_ingredient_postings(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeAmount = apps.get_model('recipes', 'RecipeAmount')
+    IngredientPosting = apps.get_model('recipes', 'IngredientPosting')
+    postings = RecipeAmount.objects.order_by().values('ingredient').annotate(
+        ids=ArrayAgg('recipe', distinct=True, ordering='recipe')
+    ).values_list('ingredient', 'ids')
+    IngredientPosting.objects.bulk_create(
+        (IngredientPosting(ingredient_id=ingredient_id, recipes=ids)
+         for ingredient_id, ids in postings.iterator()),
+        batch_size=500
+    )
+    Recipe.objects.update(ingredients_count=Coalesce(Subquery(
+        RecipeAmount.objects.filter(recipe=OuterRef('pk')).order_by()
+        .values('recipe').annotate(total=Count('pk')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientPosting',
+            fields=[
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='posting', serialize=False, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('recipes', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None, verbose_name='Рецепты')),
+            ],
+            options={
+                'verbose_name': 'Рецепты ингредиента',
+                'verbose_name_plural': 'Рецепты ингредиентов',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество ингредиентов'),
+        ),
+        migrations.RunPython(
+            fill_ingredient_postings, migrations.RunPython.noop
+        ),
+    ]
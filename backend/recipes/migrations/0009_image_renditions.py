@@ -0,0 +1,54 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def enqueue_existing_images(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageJob = apps.get_model('recipes', 'ImageJob')
+    ImageJob.objects.bulk_create(
+        (ImageJob(recipe_id=pk, source=image)
+         for pk, image in Recipe.objects.exclude(image='').values_list(
+             'pk', 'image').iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_posting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Уменьшенные копии изображения'),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходное изображение')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Дата начала')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Обработка изображения',
+                'verbose_name_plural': 'Обработка изображений',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(fields=['status', 'created'], name='image_job_idx'),
+        ),
+        migrations.RunPython(
+            enqueue_existing_images, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:18
+
+from django.db import migrations, models
+from django.db.models import Count
+import recipes.storage
+
+
+def fill_media_files(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=image, references=references)
+         for image, references in Recipe.objects.exclude(image='').order_by()
+         .values('image').annotate(references=Count('pk'))
+         .values_list('image', 'references').iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+                ('released', models.DateTimeField(blank=True, null=True, verbose_name='Дата последнего освобождения')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='recipies/image', verbose_name='Изображение'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(condition=models.Q(('references', 0)), fields=['released'], name='media_orphan_idx'),
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
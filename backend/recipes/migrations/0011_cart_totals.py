@@ -0,0 +1,53 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_cart_totals(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    CartTotal = apps.get_model('recipes', 'CartTotal')
+    totals = ShoppingCart.objects.filter(
+        recipe__ingredients__isnull=False
+    ).order_by().values('user', 'recipe__ingredients__ingredient')
+    CartTotal.objects.bulk_create(
+        (CartTotal(user_id=user_id, ingredient_id=ingredient_id,
+                   amount=amount)
+         for user_id, ingredient_id, amount in totals.annotate(
+             total=Sum('recipe__ingredients__amount')
+         ).values_list(
+             'user', 'recipe__ingredients__ingredient', 'total'
+         ).iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_media_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог корзины',
+                'verbose_name_plural': 'Итоги корзин',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='carttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_total'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:28
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_cart_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, message='Множитель порций должен быть не меньше единицы!')], verbose_name='Множитель порций'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 06:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_popularity(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    Recipe.objects.filter(score__isnull=False).update(popularity=Subquery(
+        RecipeScore.objects.filter(recipe=OuterRef('pk')).values('score')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_cart_servings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг популярности'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-pub_date', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
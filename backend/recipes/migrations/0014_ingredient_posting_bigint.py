@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:14
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_popularity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredientposting',
+            name='recipes',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, size=None, verbose_name='Рецепты'),
+        ),
+    ]
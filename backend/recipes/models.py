@@ -1,7 +1,18 @@
 from colorfield.fields import ColorField
-from django.db import models
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, SearchVectorField,
+    TrigramSimilarity
+)
+from django.db import connection, models
+from django.db.models import F, Func, Prefetch, Q, Sum, Value, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.db.models.constraints import UniqueConstraint
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import (
     MaxValueValidator,
     MinValueValidator,
@@ -9,6 +20,7 @@ from django.core.validators import (
 )
 
 from users.models import User
+from .storage import ContentAddressedStorage
 
 
 class Tag(models.Model):
@@ -66,6 +78,69 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+def recipe_search_vector():
+    return (
+        SearchVector('name', weight='A', config=settings.SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=settings.SEARCH_CONFIG)
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """Подгружает автора, тэги и ингредиенты фиксированным числом
+        запросов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients',
+                queryset=RecipeAmount.objects.select_related('ingredient')
+            )
+        )
+
+    def popular(self):
+        """Сортирует по предрассчитанному рейтингу по индексу
+        recipe_popularity_idx, рецепты без рейтинга идут последними."""
+        return self.order_by('-popularity', '-pub_date', '-id')
+
+    def trending(self):
+        """Только рецепты с рейтингом, по тому же индексу, что popular():
+        у рецептов без рейтинга popularity равна 0."""
+        return self.filter(popularity__gt=0).popular()
+
+    def search(self, value):
+        """Полнотекстовый поиск по названию и описанию с сортировкой по
+        релевантности. Опечатки в названии ловит триграммное сходство."""
+        query = SearchQuery(
+            value, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.annotate(
+            rank=SearchRank(F('search_vector'), query),
+            similarity=TrigramSimilarity('name', value)
+        ).filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).order_by('-rank', '-similarity', '-pub_date')
+
+    def latest_per_author(self, author_ids, limit):
+        """Не более limit последних рецептов каждого автора одним запросом.
+
+        Django 3.2 не умеет фильтровать по оконной функции, поэтому
+        ROW_NUMBER() считается во вложенном запросе.
+        """
+        ranked = Recipe.objects.filter(author__in=author_ids).annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        ).values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE row_number <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
     author = models.ForeignKey(
@@ -96,22 +171,172 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipies/image',
+        storage=ContentAddressedStorage(),
         verbose_name='Изображение'
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в избранное'
+    )
+    ingredients_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество ингредиентов'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    # Копия RecipeScore.score для сортировки по индексу без соединения.
+    popularity = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг популярности'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-popularity', '-pub_date', '-id'],
+                name='recipe_popularity_idx'
+            ),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+            GinIndex(
+                fields=['name'], name='recipe_name_trgm_idx',
+                opclasses=['gin_trgm_ops']
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class MediaFileQuerySet(models.QuerySet):
+
+    def acquire(self, name):
+        if not name:
+            return
+        self.bulk_create([MediaFile(name=name)], ignore_conflicts=True)
+        self.filter(name=name).update(references=F('references') + 1)
+
+    def release(self, name):
+        if not name:
+            return
+        self.filter(name=name, references__gt=0).update(
+            references=F('references') - 1,
+            released=timezone.now()
+        )
+
+
+class MediaFile(models.Model):
+    """Счётчик ссылок рецептов на файл изображения.
+
+    Файлы без ссылок удаляет команда collect_media.
+    """
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name='Файл'
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество ссылок'
+    )
+    released = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата последнего освобождения'
+    )
+
+    objects = MediaFileQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+        indexes = [
+            models.Index(
+                fields=['released'], name='media_orphan_idx',
+                condition=Q(references=0)
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name}: {self.references}'
+
+
+class ImageJob(models.Model):
+    """Задание очереди на подготовку уменьшенных копий изображения."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name='Рецепт'
+    )
+    source = models.CharField(
+        max_length=255,
+        verbose_name='Исходное изображение'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попытки'
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата постановки'
+    )
+    started = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата начала'
+    )
+
+    class Meta:
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        indexes = [
+            models.Index(fields=['status', 'created'], name='image_job_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.source}: {self.get_status_display()}'
+
+
 class FavShopCart(models.Model):
     """Родительский класс модели избранного и продуктовой корзины."""
     user = models.ForeignKey(
@@ -127,6 +352,11 @@ class FavShopCart(models.Model):
         related_name="+"
 
     )
+    added = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         abstract = True
@@ -148,12 +378,57 @@ class Favorite(FavShopCart):
 
 class ShoppingCart(FavShopCart):
     """Модель продуктовой корзины."""
+    servings = models.PositiveSmallIntegerField(
+        default=1,
+        verbose_name='Множитель порций',
+        validators=(MinValueValidator(
+            1, message='Множитель порций должен быть не меньше единицы!'
+        ),)
+    )
+
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
         default_related_name = 'shopping_carts'
 
 
+class RecipeScore(models.Model):
+    """Предрассчитанный рейтинг популярности рецепта."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(verbose_name='Рейтинг')
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата расчёта'
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(fields=['-score', 'recipe'], name='recipe_score_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score:.3f}'
+
+
+class RecipeAmountQuerySet(models.QuerySet):
+
+    def totals(self):
+        """Словарь {id ингредиента: суммарное количество}."""
+        return dict(
+            self.order_by().values('ingredient').annotate(
+                total=Sum('amount')
+            ).values_list('ingredient', 'total')
+        )
+
+
 class RecipeAmount(models.Model):
     """Модель связи рецепта и количества ингредиентов."""
     recipe = models.ForeignKey(
@@ -175,6 +450,8 @@ class RecipeAmount(models.Model):
 
     )
 
+    objects = RecipeAmountQuerySet.as_manager()
+
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Количество ингредиента'
@@ -185,3 +462,229 @@ class RecipeAmount(models.Model):
             f'{self.ingredient.name} - {self.amount}'
             f' ({self.ingredient.measurement_unit})'
         )
+
+
+class ArrayRemove(Func):
+    function = 'array_remove'
+    output_field = ArrayField(models.BigIntegerField())
+
+
+class ArrayInsertSorted(Func):
+    """Добавляет элемент в отсортированный массив без повторов."""
+    template = (
+        '(SELECT array_agg(DISTINCT item ORDER BY item) '
+        'FROM unnest(array_append(%(expressions)s)) item)'
+    )
+    output_field = ArrayField(models.BigIntegerField())
+
+
+class IngredientPostingQuerySet(models.QuerySet):
+
+    def replace(self, recipe_id, old_ids, new_ids):
+        """Переносит рецепт между списками ингредиентов по разнице
+        старого и нового состава."""
+        old_ids, new_ids = set(old_ids), set(new_ids)
+        removed = old_ids - new_ids
+        added = new_ids - old_ids
+        if removed:
+            self.filter(ingredient__in=removed).update(
+                recipes=ArrayRemove(F('recipes'), Value(recipe_id))
+            )
+        if added:
+            self.bulk_create(
+                (IngredientPosting(ingredient_id=ingredient_id, recipes=[])
+                 for ingredient_id in added),
+                ignore_conflicts=True
+            )
+            self.filter(ingredient__in=added).update(
+                recipes=ArrayInsertSorted(F('recipes'), Value(recipe_id))
+            )
+        if old_ids != new_ids:
+            Recipe.objects.filter(pk=recipe_id).update(
+                ingredients_count=len(new_ids)
+            )
+
+    def rebuild(self):
+        """Полностью пересобирает индекс по RecipeAmount."""
+        postings = RecipeAmount.objects.order_by().values(
+            'ingredient'
+        ).annotate(
+            ids=ArrayAgg('recipe', distinct=True, ordering='recipe')
+        ).values_list('ingredient', 'ids')
+        self.all().delete()
+        self.bulk_create(
+            (IngredientPosting(ingredient_id=ingredient_id, recipes=ids)
+             for ingredient_id, ids in postings.iterator()),
+            batch_size=500
+        )
+
+    def rank(self, ingredient_ids):
+        """Рецепты с ингредиентами из набора по доле имеющихся."""
+        return CookableRanking(ingredient_ids)
+
+
+class IngredientPosting(models.Model):
+    """Обратный индекс: ингредиент и отсортированные id рецептов с ним."""
+    ingredient = models.OneToOneField(
+        Ingredient,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='posting',
+        verbose_name='Ингредиент'
+    )
+    recipes = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        verbose_name='Рецепты'
+    )
+
+    objects = IngredientPostingQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Рецепты ингредиента'
+        verbose_name_plural = 'Рецепты ингредиентов'
+
+    def __str__(self):
+        return f'{self.ingredient_id}: {len(self.recipes)}'
+
+
+class CookableRanking:
+    """Рецепты хотя бы с одним ингредиентом из набора по убыванию доли
+    имеющихся ингредиентов, при равенстве выше рецепты с большим числом
+    совпадений.
+
+    Доля считается и сортируется в базе, срез выбирает из неё страницу
+    пар (id рецепта, доля), count() - число подходящих рецептов.
+    """
+
+    def __init__(self, ingredient_ids):
+        self.ingredient_ids = sorted(ingredient_ids)
+
+    def execute(self, select, rest='', params=()):
+        postings = IngredientPosting._meta.db_table
+        recipes = Recipe._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH matched AS ('
+                f'SELECT recipe_id, count(*) AS matched '
+                f'FROM {postings}, unnest(recipes) AS posting (recipe_id) '
+                f'WHERE ingredient_id = ANY(%s::bigint[]) '
+                f'GROUP BY recipe_id) '
+                f'SELECT {select} FROM matched '
+                f'JOIN {recipes} recipe ON recipe.id = matched.recipe_id '
+                f'{rest}',
+                (self.ingredient_ids, *params)
+            )
+            return cursor.fetchall()
+
+    def count(self):
+        return self.execute('count(*)')[0][0]
+
+    def __getitem__(self, page):
+        if not isinstance(page, slice) or page.step is not None:
+            raise TypeError('Поддерживаются только срезы без шага')
+        offset = page.start or 0
+        limit = None if page.stop is None else max(page.stop - offset, 0)
+        return self.execute(
+            'recipe.id, matched.matched::float '
+            '/ GREATEST(recipe.ingredients_count, matched.matched) '
+            'AS coverage',
+            'ORDER BY coverage DESC, matched.matched DESC, recipe.id DESC '
+            'LIMIT %s OFFSET %s',
+            (limit, offset)
+        )
+
+
+class CartTotalQuerySet(models.QuerySet):
+
+    def shift(self, carts, deltas):
+        """Прибавляет изменения {id ингредиента: количество на одну
+        порцию} к итогам владельцев корзин carts с учётом множителя
+        порций, обнулившиеся строки удаляет."""
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        query = carts.order_by().values('user_id', 'servings').query
+        users, params = query.sql_with_params()
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                f'SELECT cart.user_id, delta.ingredient_id, '
+                f'delta.amount * cart.servings '
+                f'FROM ({users}) cart CROSS JOIN '
+                f'unnest(%s::bigint[], %s::integer[]) '
+                f'AS delta (ingredient_id, amount) '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = {table}.amount + EXCLUDED.amount',
+                (*params, list(deltas), list(deltas.values()))
+            )
+        if min(deltas.values()) < 0:
+            self.filter(
+                user__in=carts.values('user_id'), amount__lte=0
+            ).delete()
+
+    def add_recipe(self, cart, sign=1):
+        """Добавляет состав рецепта к итогам корзины (sign=-1 вычитает)."""
+        self.shift(
+            ShoppingCart.objects.filter(pk=cart.pk),
+            {
+                pk: sign * amount for pk, amount in
+                RecipeAmount.objects.filter(recipe=cart.recipe_id)
+                .totals().items()
+            }
+        )
+
+    def update_recipe(self, recipe_id, old, new):
+        """Переносит изменение состава рецепта в корзины с ним."""
+        self.shift(
+            ShoppingCart.objects.filter(recipe=recipe_id),
+            {pk: new.get(pk, 0) - old.get(pk, 0) for pk in {*old, *new}}
+        )
+
+    def rebuild(self):
+        """Полностью пересчитывает итоги по корзинам."""
+        totals = ShoppingCart.objects.filter(
+            recipe__ingredients__isnull=False
+        ).order_by().values('user', 'recipe__ingredients__ingredient')
+        totals = totals.annotate(
+            total=Sum(F('recipe__ingredients__amount') * F('servings'))
+        ).values_list('user', 'recipe__ingredients__ingredient', 'total')
+        self.all().delete()
+        self.bulk_create(
+            (CartTotal(user_id=user_id, ingredient_id=ingredient_id,
+                       amount=amount)
+             for user_id, ingredient_id, amount in totals.iterator()),
+            batch_size=1000
+        )
+
+
+class CartTotal(models.Model):
+    """Суммарное количество ингредиента во всех рецептах корзины."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+
+    objects = CartTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Итог корзины'
+        verbose_name_plural = 'Итоги корзин'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_cart_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.ingredient_id} - {self.amount}'
@@ -0,0 +1,123 @@
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from users.models import User
+from . import images
+from .models import (
+    CartTotal, Favorite, IngredientPosting, MediaFile, Recipe, RecipeAmount,
+    ShoppingCart, recipe_search_vector
+)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        pk=instance.recipe_id, favorites_count__gt=0
+    ).update(favorites_count=F('favorites_count') - 1)
+
+
+@receiver(post_init, sender=ShoppingCart)
+def remember_servings(sender, instance, **kwargs):
+    instance._stored_servings = instance.__dict__.get('servings')
+
+
+# Итоги пересчитываются вычитанием старого вклада позиции и прибавлением
+# нового, поэтому сохранение должно идти в транзакции.
+@receiver(pre_save, sender=ShoppingCart)
+def cart_item_saving(sender, instance, **kwargs):
+    if (
+        not instance._state.adding
+        and instance.servings != instance._stored_servings
+    ):
+        CartTotal.objects.add_recipe(instance, sign=-1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_saved(sender, instance, created, **kwargs):
+    if created or instance.servings != instance._stored_servings:
+        CartTotal.objects.add_recipe(instance)
+        instance._stored_servings = instance.servings
+
+
+# До удаления: при удалении рецепта его состав ещё не стёрт каскадом.
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_item_deleting(sender, instance, **kwargs):
+    CartTotal.objects.add_recipe(instance, sign=-1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(sender, instance, update_fields, **kwargs):
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    Recipe.objects.filter(pk=instance.pk).update(
+        search_vector=recipe_search_vector()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def enqueue_image(sender, instance, **kwargs):
+    if instance.image and (
+        instance.image.name != instance.image_renditions.get('source')
+    ):
+        images.enqueue(instance)
+
+
+def image_name(recipe):
+    # Без обращения к дескриптору, чтобы не загружать отложенное поле.
+    value = recipe.__dict__.get('image')
+    return getattr(value, 'name', value)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    instance._stored_image = image_name(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_references(sender, instance, created, **kwargs):
+    if 'image' not in instance.__dict__:
+        return
+    name = image_name(instance)
+    stored = None if created else instance._stored_image
+    if name != stored:
+        MediaFile.objects.acquire(name)
+        MediaFile.objects.release(stored)
+        instance._stored_image = name
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    User.objects.filter(
+        pk=instance.author_id, recipes_count__gt=0
+    ).update(recipes_count=F('recipes_count') - 1)
+    MediaFile.objects.release(image_name(instance))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    IngredientPosting.objects.replace(
+        instance.pk,
+        RecipeAmount.objects.filter(recipe=instance).values_list(
+            'ingredient_id', flat=True
+        ),
+        ()
+    )
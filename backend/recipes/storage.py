@@ -0,0 +1,54 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class IdempotentStorage(FileSystemStorage):
+    """Хранилище, где имя однозначно определяет содержимое файла.
+
+    Повторная запись по тому же имени перезаписывает файл теми же
+    байтами вместо создания копии с суффиксом.
+    """
+    # Без O_EXCL параллельная запись одного и того же файла безопасна.
+    OS_OPEN_FLAGS = FileSystemStorage.OS_OPEN_FLAGS & ~os.O_EXCL
+
+    def save(self, name, content, max_length=None):
+        if hasattr(content, 'temporary_file_path'):
+            # Перенос временного файла не перезаписывает существующий,
+            # поэтому такой файл тоже копируется потоком.
+            content = File(content.file, name)
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+
+class ContentAddressedStorage(IdempotentStorage):
+    """Хранилище, называющее файлы по SHA-256 содержимого.
+
+    Одинаковые файлы попадают на диск один раз: повторная загрузка
+    только обновляет время изменения, по которому сборщик мусора
+    отличает недавно использованные файлы.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(
+            posixpath.dirname(name), digest[:2], digest + extension
+        )
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
@@ -7,6 +7,6 @@ from users.models import User
 class UserAdmin(admin.ModelAdmin):
     list_display = (
         'username', 'first_name', 'last_name',
-        'email'
+        'email', 'recipes_count', 'followers_count'
     )
     search_fields = ('email', 'username')
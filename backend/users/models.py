@@ -37,6 +37,16 @@ class User(AbstractUser):
         max_length=settings.UNIVERSAL_FIELD_LENGTH,
         verbose_name='Пароль пользователя'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
 
 
 class Follow(models.Model):
@@ -66,6 +76,9 @@ class Follow(models.Model):
             )
 
         ]
+        indexes = [
+            models.Index(fields=['user', '-id'], name='follow_user_id_idx')
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 